@@ -1,35 +1,303 @@
 """
 Analysis functions:
 - compute_timescale: compute the timescale of a set of signals
+- compute_acf: compute the autocorrelation function of a set of signals via FFT
+- fit_acf: fit an exponential decay to a set of autocorrelation functions
 - compute_exponent: compute the exponent of a set of power spectra
+- compute_exponent_chunked: fit power spectra in chunks across a process pool
+- compute_exponent_timeseries: track the exponent over time from rolling spectra
 - compute_complexity: compute the Lempel-Ziv complexity of a set of signals
+- compute_windowed_complexity: compute sliding-window, multiscale complexity
+- coarse_grain: average signals over non-overlapping blocks
 - lempel_ziv_complexity: calculate the Lempel-Ziv complexity of a binary array
+- lempel_ziv_complexity_reference: original set-based Lempel-Ziv implementation
 """
 
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
+from scipy.fft import rfft, irfft, next_fast_len
 from specparam import SpectralGroupModel
-from timescales.fit import ACF
 
 import sys
 sys.path.append("code")
 from settings import SPECPARAM_SETTINGS, N_JOBS
+from utils import get_n_jobs
+from cache import get_cache
+from spectral import compute_spectrogram
 
+# compute_acf: with nlags='auto', lags are capped at this multiple of the 
+# slowest 1/e decay time across signals
+AUTO_LAG_FACTOR = 10
 
-def compute_timescale(signals, fs, nlags=None):
-    """Compute the timescale of a set of signals"""
 
-    if nlags is None:
-        nlags = int(0.5 * signals.shape[1])
-        
-    acf = ACF()
-    acf.compute_acf(signals, fs, nlags=nlags)
-    acf.fit()
-    timescale = acf.params[:, 0]
+def compute_timescale(signals, fs, nlags=None, backend='fft', dtype=np.float64,
+                      cache=False):
+    """
+    Compute the timescale of a set of signals.
+
+    The autocorrelation function (ACF) of each signal is fit with an 
+    exponential decay and the decay time constant is returned. By default, the 
+    ACFs of all signals are computed at once via FFT and the exponential decay 
+    is fit to all signals at once (see compute_acf and fit_acf).
+
+    Parameters
+    ----------
+    signals : np.array
+        Array of shape (n_samples,), (n_channels, n_samples) or 
+        (n_epochs, n_channels, n_samples).
+    fs : float
+        Sampling frequency in Hz.
+    nlags : int or 'auto', optional
+        Number of lags to fit. If None (default), half the signal length is 
+        used. If 'auto', lags are capped at a multiple of the slowest 1/e decay 
+        time across signals (see AUTO_LAG_FACTOR).
+    backend : {'fft', 'timescales'}, optional
+        'fft' (default) uses the in-project FFT implementation. 'timescales' 
+        uses timescales.fit.ACF, fitting one signal at a time.
+    dtype : np.dtype, optional
+        Precision of the FFT, by default np.float64. Use np.float32 to halve 
+        memory on long recordings.
+    cache : bool, str or FitCache, optional
+        Cache results on disk, keyed on the signals and all other arguments 
+        (see cache.FitCache). True uses CACHE_DIR. By default False.
+
+    Returns
+    -------
+    timescale : np.array or float
+        Timescale (s) of each signal, shaped like the leading dimensions of 
+        signals (a float for 1D input).
+    """
+
+    signals = np.asarray(signals)
+    rows = signals.reshape(-1, signals.shape[-1])
+
+    # check cache
+    cache = get_cache(cache)
+    if cache is not None:
+        key = cache.make_key(signals, func='compute_timescale', fs=fs, 
+                             nlags=nlags, backend=backend, 
+                             dtype=np.dtype(dtype).str)
+        timescale = cache.get(key)
+        if timescale is not None:
+            return float(timescale) if timescale.ndim == 0 else timescale
+
+    if backend == 'fft':
+        lags, corrs = compute_acf(rows, nlags=nlags, dtype=dtype)
+        params = fit_acf(lags, corrs, fs)
+
+    elif backend == 'timescales':
+        from timescales.fit import ACF
+
+        if nlags is None or nlags == 'auto':
+            nlags = int(0.5 * signals.shape[-1])
+        acf = ACF()
+        acf.compute_acf(rows, fs, nlags=nlags)
+        acf.fit()
+        params = acf.params.reshape(len(rows), -1)
+
+    else:
+        raise ValueError("backend must be 'fft' or 'timescales'")
+
+    timescale = params[:, 0].reshape(signals.shape[:-1])
+    if cache is not None:
+        cache.set(key, timescale)
+    if timescale.ndim == 0:
+        timescale = float(timescale)
 
     return timescale
 
 
-def compute_exponent(spectra, freqs, ap_mode='knee', freq_range=None):
+def compute_acf(signals, nlags=None, dtype=np.float64, workers=None):
+    """
+    Compute the autocorrelation function of a set of signals via FFT.
+
+    Signals are demeaned and zero-padded to avoid circular wrap-around, and the 
+    biased autocovariance is normalized by its value at lag 0 (as in 
+    statsmodels.tsa.stattools.acf).
+
+    Parameters
+    ----------
+    signals : np.array
+        Array of shape (n_samples,) or (n_signals, n_samples).
+    nlags : int or 'auto', optional
+        Number of lags to return. If None (default), half the signal length is 
+        used. If 'auto', lags are capped at AUTO_LAG_FACTOR times the slowest 
+        1/e decay time across signals.
+    dtype : np.dtype, optional
+        Precision of the FFT, by default np.float64.
+    workers : int, optional
+        Number of workers passed to scipy.fft. Defaults to N_JOBS.
+
+    Returns
+    -------
+    lags : np.array
+        Lags (samples), from 1 to nlags.
+    corrs : np.array
+        Autocorrelation of each signal at each lag, of shape 
+        (n_signals, nlags) (or (nlags,) for 1D input).
+    """
+
+    # demean signals
+    signals = np.asarray(signals, dtype=dtype)
+    n_samples = signals.shape[-1]
+    signals = signals - np.mean(signals, axis=-1, keepdims=True)
+
+    # compute autocovariance via FFT, zero-padded to avoid circular overlap
+    if workers is None:
+        workers = N_JOBS
+    n_fft = next_fast_len(2 * n_samples - 1, real=True)
+    spectrum = rfft(signals, n=n_fft, axis=-1, workers=workers)
+    acov = irfft(spectrum.real**2 + spectrum.imag**2, n=n_fft, axis=-1, 
+                 workers=workers)[..., :n_samples // 2 + 1]
+
+    # normalize by lag 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corrs = acov / acov[..., :1]
+
+    # determine number of lags
+    max_lags = n_samples // 2
+    if nlags is None:
+        nlags = max_lags
+    elif nlags == 'auto':
+        below = corrs < np.exp(-1)
+        decayed = below.any(axis=-1)
+        if np.all(decayed):
+            n_decay = np.max(np.argmax(below, axis=-1))
+            nlags = int(AUTO_LAG_FACTOR * max(n_decay, 1))
+        else:
+            nlags = max_lags
+    nlags = int(min(nlags, max_lags))
+    lags = np.arange(1, nlags + 1)
+
+    return lags, corrs[..., 1:nlags + 1]
+
+
+def fit_acf(lags, corrs, fs, n_taus=200, n_iter=40):
+    """
+    Fit an exponential decay to a set of autocorrelation functions.
+
+    The model is corrs = height * exp(-lags / (tau * fs)) + offset. For a 
+    fixed tau the model is linear in height and offset, which are solved in 
+    closed form for all signals at once. Tau is first located on a logarithmic 
+    grid and then refined by golden-section search, vectorized across signals.
+
+    Parameters
+    ----------
+    lags : np.array
+        Lags (samples).
+    corrs : np.array
+        Autocorrelation of shape (n_signals, n_lags) or (n_lags,).
+    fs : float
+        Sampling frequency in Hz.
+    n_taus : int, optional
+        Number of points in the initial tau grid, by default 200.
+    n_iter : int, optional
+        Number of golden-section iterations, by default 40.
+
+    Returns
+    -------
+    params : np.array
+        Fit parameters [tau (s), height, offset] of shape (n_signals, 3).
+    """
+
+    lags = np.asarray(lags, dtype=np.float64)
+    corrs = np.atleast_2d(np.asarray(corrs, dtype=np.float64))
+    n_lags = len(lags)
+
+    # sufficient statistics that do not depend on tau
+    sum_y = corrs.sum(axis=1)
+    sum_yy = np.sum(corrs**2, axis=1)
+
+    def solve(basis, sum_ey):
+        """Closed-form least squares for height and offset given the basis."""
+        sum_e = basis.sum(axis=-1)
+        sum_ee = np.sum(basis**2, axis=-1)
+        if sum_ey.ndim > 1:
+            sum_e, sum_ee = sum_e[:, None], sum_ee[:, None]
+        det = sum_ee * n_lags - sum_e**2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            height = (n_lags * sum_ey - sum_e * sum_y) / det
+            offset = (sum_ee * sum_y - sum_e * sum_ey) / det
+        sse = sum_yy - height * sum_ey - offset * sum_y
+
+        return np.nan_to_num(sse, nan=np.inf), height, offset
+
+    def evaluate(log_tau):
+        """Fit each signal with its own tau."""
+        basis = np.exp(-lags / (np.exp(log_tau[:, None]) * fs))
+        return solve(basis, np.sum(basis * corrs, axis=1))
+
+    # coarse grid search over log(tau), in blocks to bound memory
+    log_taus = np.linspace(np.log(0.5 / fs), np.log(10 * lags[-1] / fs), n_taus)
+    sse = np.zeros((n_taus, len(corrs)))
+    for i_start in range(0, n_taus, 16):
+        basis = np.exp(-lags / (np.exp(log_taus[i_start:i_start + 16, None]) * fs))
+        sse[i_start:i_start + 16] = solve(basis, basis @ corrs.T)[0]
+    i_best = np.argmin(sse, axis=0)
+
+    # refine by golden-section search between neighbouring grid points
+    ratio = (np.sqrt(5) - 1) / 2
+    lower = log_taus[np.maximum(i_best - 1, 0)]
+    upper = log_taus[np.minimum(i_best + 1, n_taus - 1)]
+    x1 = upper - ratio * (upper - lower)
+    x2 = lower + ratio * (upper - lower)
+    f1, f2 = evaluate(x1)[0], evaluate(x2)[0]
+    for _ in range(n_iter):
+        # keep the bracket containing the lower of the two interior points
+        left = f1 < f2
+        upper = np.where(left, x2, upper)
+        lower = np.where(left, lower, x1)
+        x_new = np.where(left, upper - ratio * (upper - lower), 
+                         lower + ratio * (upper - lower))
+        f_new = evaluate(x_new)[0]
+        x1, x2 = np.where(left, x_new, x2), np.where(left, x1, x_new)
+        f1, f2 = np.where(left, f_new, f2), np.where(left, f1, f_new)
+
+    log_tau = (lower + upper) / 2
+    _, height, offset = evaluate(log_tau)
+    params = np.stack([np.exp(log_tau), height, offset], axis=1)
+
+    return params
+
+
+def compute_exponent(spectra, freqs, ap_mode='knee', freq_range=None, 
+                     cache=False):
+    """
+    Compute the aperiodic exponent of a set of power spectra.
+
+    Parameters
+    ----------
+    spectra : np.array
+        Power spectra of shape (n_spectra, n_freqs).
+    freqs : np.array
+        Frequencies corresponding to the power spectra.
+    ap_mode : str, optional
+        Aperiodic mode ('knee' or 'fixed'), by default 'knee'.
+    freq_range : list of float, optional
+        Frequency range to fit, by default None (all frequencies).
+    cache : bool, str or FitCache, optional
+        Cache results on disk, keyed on the spectra, freqs, fit arguments and 
+        SPECPARAM_SETTINGS (see cache.FitCache). True uses CACHE_DIR. By 
+        default False.
+
+    Returns
+    -------
+    exponent : np.array
+        Aperiodic exponent of each spectrum.
+    """
+
+    # check cache
+    cache = get_cache(cache)
+    if cache is not None:
+        key = cache.make_key(spectra, freqs, func='compute_exponent', 
+                             ap_mode=ap_mode, freq_range=freq_range, 
+                             settings=SPECPARAM_SETTINGS)
+        exponent = cache.get(key)
+        if exponent is not None:
+            return exponent
 
     # fit power spectra
     sgm = SpectralGroupModel(**SPECPARAM_SETTINGS, aperiodic_mode=ap_mode, 
@@ -37,22 +305,390 @@ def compute_exponent(spectra, freqs, ap_mode='knee', freq_range=None):
     sgm.fit(freqs, spectra, n_jobs=N_JOBS, freq_range=freq_range)
     exponent = sgm.get_params('aperiodic', 'exponent')
 
+    if cache is not None:
+        cache.set(key, exponent)
+
     return exponent
 
 
-def compute_complexity(signals):
-    """Binaraize signals and compute the Lempel-Ziv complexity"""
+def compute_exponent_chunked(spectra, freqs, ap_mode='knee', freq_range=None,
+                             chunk_size=64, path_out=None, n_jobs=N_JOBS, 
+                             verbose=True):
+    """
+    Fit power spectra in chunks across a process pool.
+
+    Spectra are split into chunks which are fit independently by worker 
+    processes, each with its own SpectralGroupModel. Results are identical to 
+    compute_exponent(), as each spectrum is fit independently. If path_out is 
+    given, the results of each chunk are written to disk as soon as they are 
+    complete, and chunks already present in path_out are loaded rather than 
+    refit, so an interrupted run can be resumed by calling the function again 
+    with the same arguments.
+
+    Parameters
+    ----------
+    spectra : np.array
+        Power spectra of shape (n_spectra, n_freqs) or 
+        (n_epochs, n_channels, n_freqs).
+    freqs : np.array
+        Frequencies corresponding to the power spectra.
+    ap_mode : str, optional
+        Aperiodic mode ('knee' or 'fixed'), by default 'knee'.
+    freq_range : list of float, optional
+        Frequency range to fit, by default None (all frequencies).
+    chunk_size : int, optional
+        Number of spectra per chunk, by default 64.
+    path_out : str, optional
+        Directory to store results of each chunk. If None, results are kept in 
+        memory only.
+    n_jobs : int, optional
+        Number of worker processes, by default N_JOBS. -1 uses all CPUs.
+    verbose : bool, optional
+        Whether to print progress, by default True.
+
+    Returns
+    -------
+    exponent, knee, offset : np.array
+        Aperiodic parameters, shaped like the leading dimensions of spectra. 
+        knee is NaN if ap_mode is not 'knee'.
+    """
+
+    # split spectra into chunks
+    spectra = np.asarray(spectra)
+    rows = spectra.reshape(-1, spectra.shape[-1])
+    starts = np.arange(0, len(rows), chunk_size)
+    params = np.full((len(rows), 3), np.nan)
+
+    # load chunks completed by a previous run
+    todo = list(range(len(starts)))
+    if path_out is not None:
+        todo = _check_chunk_dir(path_out, rows, freqs, ap_mode, freq_range, 
+                                chunk_size)
+        for i_chunk in set(range(len(starts))) - set(todo):
+            with np.load(_chunk_fname(path_out, i_chunk)) as data_in:
+                params[starts[i_chunk]:starts[i_chunk] + chunk_size] = \
+                    data_in['params']
+        if verbose and len(todo) < len(starts):
+            print(f"  Loaded {len(starts) - len(todo)}/{len(starts)} chunks "
+                  f"from {path_out}")
+
+    # fit remaining chunks
+    n_workers = min(get_n_jobs(n_jobs), max(len(todo), 1))
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(_fit_aperiodic, 
+                                   rows[starts[ii]:starts[ii] + chunk_size], 
+                                   freqs, ap_mode, freq_range) : ii 
+                   for ii in todo}
+        for i_done, future in enumerate(as_completed(futures)):
+            i_chunk = futures[future]
+            params[starts[i_chunk]:starts[i_chunk] + chunk_size] = future.result()
+
+            # save results of chunk
+            if path_out is not None:
+                _save_chunk(path_out, i_chunk, future.result())
+            if verbose:
+                print(f"  Fit chunk {i_done + 1}/{len(todo)}")
+
+    # reshape to leading dimensions of spectra
+    params = params.reshape(*spectra.shape[:-1], 3)
+    exponent, knee, offset = params[..., 0], params[..., 1], params[..., 2]
+
+    return exponent, knee, offset
+
+
+def compute_exponent_timeseries(signals, fs, window, hop=None, nperseg=2**12, 
+                                ap_mode='knee', freq_range=None, chunk_size=64,
+                                path_out=None, n_jobs=N_JOBS, verbose=True):
+    """
+    Track the aperiodic exponent over time.
+
+    Rolling power spectra are computed with spectral.compute_spectrogram and 
+    fit in batches with compute_exponent_chunked.
+
+    Parameters
+    ----------
+    signals : np.array
+        Array of shape (n_samples,), (n_channels, n_samples) or 
+        (n_epochs, n_channels, n_samples). May be an np.memmap.
+    fs : float
+        Sampling frequency in Hz.
+    window : int
+        Length of each window (samples).
+    hop : int, optional
+        Step between the start of consecutive windows (samples). Defaults to 
+        window (non-overlapping windows). Every window must contain a complete 
+        segment (see spectral.compute_spectrogram).
+    nperseg : int, optional
+        Length of each segment for Welch's method, by default 2**12.
+    ap_mode, freq_range, chunk_size, path_out, n_jobs, verbose : optional
+        See compute_exponent_chunked.
+
+    Returns
+    -------
+    times : np.array
+        Time of the center of each window (s).
+    exponent : np.array
+        Aperiodic exponent of shape (..., n_windows).
+    """
+
+    # compute rolling power spectra
+    freqs, times, spectrogram = compute_spectrogram(signals, fs, window, hop, 
+                                                    nperseg)
 
-    complexity = np.zeros(len(signals))
-    for ii in range(len(signals)):
-        # remove mean
-        signal = signals[ii] - np.mean(signals[ii])
+    # fit spectra in batches
+    exponent, _, _ = compute_exponent_chunked(spectrogram, freqs, ap_mode, 
+                                              freq_range, chunk_size, path_out,
+                                              n_jobs, verbose)
 
-        # binarize signals
-        signal = np.array(signal > 0, dtype=int)
+    return times, exponent
 
-        # compute complexity
-        complexity[ii] = lempel_ziv_complexity(signal)
+
+def _fit_aperiodic(spectra, freqs, ap_mode, freq_range):
+    """
+    Fit a chunk of spectra and return the aperiodic parameters 
+    [exponent, knee, offset] of shape (n_spectra, 3).
+    """
+
+    sgm = SpectralGroupModel(**SPECPARAM_SETTINGS, aperiodic_mode=ap_mode, 
+                             verbose=False)
+    sgm.fit(freqs, spectra, n_jobs=1, freq_range=freq_range)
+
+    params = np.full((len(spectra), 3), np.nan)
+    params[:, 0] = sgm.get_params('aperiodic', 'exponent')
+    if ap_mode == 'knee':
+        params[:, 1] = sgm.get_params('aperiodic', 'knee')
+    params[:, 2] = sgm.get_params('aperiodic', 'offset')
+
+    return params
+
+
+def _chunk_fname(path_out, i_chunk):
+    return os.path.join(path_out, f"chunk_{i_chunk:05d}.npz")
+
+
+def _save_chunk(path_out, i_chunk, params):
+    """Write chunk results atomically, so a crash never leaves a partial file."""
+
+    fname = _chunk_fname(path_out, i_chunk)
+    with open(f"{fname}.tmp", 'wb') as f:
+        np.savez(f, params=params)
+    os.replace(f"{fname}.tmp", fname)
+
+
+def _check_chunk_dir(path_out, spectra, freqs, ap_mode, freq_range, chunk_size):
+    """
+    Create or validate the chunk directory and return the indices of chunks 
+    that still need to be fit.
+    """
+
+    # describe the run, so results of a different run are never reused
+    manifest = {
+        'spectra_hash' : hashlib.sha1(np.ascontiguousarray(spectra)).hexdigest(),
+        'freqs_hash' : hashlib.sha1(np.ascontiguousarray(freqs)).hexdigest(),
+        'n_spectra' : len(spectra),
+        'chunk_size' : int(chunk_size),
+        'ap_mode' : ap_mode,
+        'freq_range' : None if freq_range is None else list(map(float, freq_range)),
+        'settings' : repr(SPECPARAM_SETTINGS)
+    }
+
+    # create directory or check that it belongs to this run
+    fname = os.path.join(path_out, 'manifest.json')
+    os.makedirs(path_out, exist_ok=True)
+    if os.path.exists(fname):
+        with open(fname, 'r') as f:
+            if json.load(f) != manifest:
+                raise ValueError(f"{path_out} contains results of a different "
+                                 "fit. Please use a new directory.")
+    else:
+        with open(fname, 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+    n_chunks = int(np.ceil(len(spectra) / chunk_size))
+    todo = [ii for ii in range(n_chunks) 
+            if not os.path.exists(_chunk_fname(path_out, ii))]
+
+    return todo
+
+
+def compute_complexity(signals, window=None, hop=None, scales=None, 
+                       n_jobs=N_JOBS):
+    """
+    Binarize signals and compute the Lempel-Ziv complexity.
+
+    Each signal is binarized about its mean in a single vectorized step, then 
+    the complexity of each binary sequence is computed in parallel. Optionally, 
+    complexity can be computed over sliding windows and/or across multiple 
+    coarse-graining scales (see compute_windowed_complexity).
+
+    Parameters
+    ----------
+    signals : np.array
+        Array of shape (n_samples,), (n_channels, n_samples) or 
+        (n_epochs, n_channels, n_samples).
+    window : int, optional
+        Length of sliding windows (samples). If None (default) and scales is 
+        None, the complexity of each whole signal is computed.
+    hop : int, optional
+        Step between the start of consecutive windows (samples). Defaults to 
+        window (non-overlapping windows).
+    scales : list of int, optional
+        Coarse-graining scales. Signals are averaged over non-overlapping 
+        blocks of each scale before binarization.
+    n_jobs : int, optional
+        Number of worker processes, by default N_JOBS. -1 uses all CPUs.
+
+    Returns
+    -------
+    complexity : np.array or float
+        Lempel-Ziv complexity of each signal, shaped like the leading 
+        dimensions of signals (a float for 1D input). In windowed/multiscale 
+        mode, see compute_windowed_complexity.
+    """
+
+    if window is not None or scales is not None:
+        return compute_windowed_complexity(signals, window, hop, scales, 
+                                           n_jobs=n_jobs)
+
+    # binarize signals about their mean
+    signals = np.asarray(signals)
+    binary = (signals > np.mean(signals, axis=-1, keepdims=True)).astype(np.uint8)
+
+    # compute complexity of each signal
+    rows = binary.reshape(-1, binary.shape[-1])
+    n_workers = min(get_n_jobs(n_jobs), len(rows))
+    if n_workers <= 1:
+        complexity = [lempel_ziv_complexity(row) for row in rows]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            complexity = list(executor.map(lempel_ziv_complexity, rows))
+
+    complexity = np.array(complexity, dtype=float).reshape(signals.shape[:-1])
+    if complexity.ndim == 0:
+        complexity = float(complexity)
+
+    return complexity
+
+
+def compute_windowed_complexity(signals, window=None, hop=None, scales=None,
+                                n_jobs=N_JOBS):
+    """
+    Compute Lempel-Ziv complexity over sliding windows and coarse-graining 
+    scales.
+
+    Windows are defined in samples of the original signal so that windows are 
+    aligned in time across scales. Each signal is coarse-grained once per scale 
+    and window means are obtained from a single cumulative sum, so the only 
+    per-window work is binarizing the window about its mean and parsing it. 
+    Each (signal, scale) pair is processed by a separate worker.
+
+    Parameters
+    ----------
+    signals : np.array
+        Array of shape (n_samples,), (n_channels, n_samples) or 
+        (n_epochs, n_channels, n_samples).
+    window : int, optional
+        Length of sliding windows (samples). If None, the whole signal is used.
+    hop : int, optional
+        Step between the start of consecutive windows (samples). Defaults to 
+        window (non-overlapping windows).
+    scales : list of int, optional
+        Coarse-graining scales. Defaults to [1] (no coarse-graining).
+    n_jobs : int, optional
+        Number of worker processes, by default N_JOBS. -1 uses all CPUs.
+
+    Returns
+    -------
+    complexity : np.array
+        Lempel-Ziv complexity of shape (*leading_dims, n_scales, n_windows). 
+        The scales axis is dropped if scales is None and the windows axis is 
+        dropped if window is None.
+    """
+
+    # check inputs
+    signals = np.asarray(signals)
+    n_samples = signals.shape[-1]
+    if window is None:
+        window_, hop_ = n_samples, n_samples
+    else:
+        window_ = int(window)
+        hop_ = window_ if hop is None else int(hop)
+    scales_ = [1] if scales is None else [int(scale) for scale in scales]
+    if window_ > n_samples or hop_ < 1:
+        raise ValueError("window must not exceed the signal length and hop "
+                         "must be positive")
+    if min(scales_) < 1 or window_ // max(scales_) < 1:
+        raise ValueError("scales must be positive and no larger than window")
+
+    # window start times (samples of the original signal)
+    starts = np.arange(0, n_samples - window_ + 1, hop_)
+
+    # one task for each signal and scale
+    rows = signals.reshape(-1, n_samples)
+    tasks = [(row, scale, starts, window_) for row in rows for scale in scales_]
+    n_workers = min(get_n_jobs(n_jobs), len(tasks))
+    if n_workers <= 1:
+        complexity = [_compute_window_complexity(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            complexity = list(executor.map(_compute_window_complexity, 
+                                           *zip(*tasks)))
+
+    # reshape to (*leading_dims, n_scales, n_windows)
+    complexity = np.array(complexity, dtype=float).reshape(
+        *signals.shape[:-1], len(scales_), len(starts))
+    if window is None:
+        complexity = complexity[..., 0]
+    if scales is None:
+        complexity = complexity[..., 0] if window is None else complexity[..., 0, :]
+
+    return complexity
+
+
+def coarse_grain(signals, scale):
+    """
+    Coarse-grain signals by averaging over non-overlapping blocks.
+
+    Parameters
+    ----------
+    signals : np.array
+        Array of signals; coarse-graining is applied along the last axis.
+    scale : int
+        Number of samples per block. Trailing samples that do not fill a block 
+        are dropped.
+
+    Returns
+    -------
+    np.array
+        Coarse-grained signals.
+    """
+
+    n_blocks = signals.shape[-1] // scale
+    blocks = signals[..., :n_blocks * scale]
+
+    return blocks.reshape(*signals.shape[:-1], n_blocks, scale).mean(axis=-1)
+
+
+def _compute_window_complexity(signal, scale, starts, window):
+    """
+    Compute the Lempel-Ziv complexity of windows of a single signal at a single
+    coarse-graining scale.
+    """
+
+    # coarse-grain signal and convert windows to the coarse time base
+    signal = coarse_grain(signal - np.mean(signal), scale)
+    starts = starts // scale
+    window = window // scale
+
+    # window means from a single cumulative sum
+    cumsum = np.concatenate([[0], np.cumsum(signal)])
+    means = (cumsum[starts + window] - cumsum[starts]) / window
+
+    # binarize each window about its mean and compute complexity
+    complexity = np.zeros(len(starts))
+    for ii, (start, mean) in enumerate(zip(starts, means)):
+        binary = signal[start:start + window] > mean
+        complexity[ii] = lempel_ziv_complexity(binary.view(np.uint8))
 
     return complexity
 
@@ -61,6 +697,57 @@ def lempel_ziv_complexity(binary_array):
     """
     Calculate the Lempel-Ziv complexity of a binary array of integers.
 
+    The sequence is parsed into phrases, each being the shortest prefix of the 
+    remaining sequence that has not been seen before (LZ78 parsing), and the 
+    number of distinct phrases is returned. Phrases are stored in a binary trie 
+    held in a flat list, so each sample costs a single lookup and the run time 
+    is linear in the length of the sequence. Results are identical to 
+    lempel_ziv_complexity_reference().
+
+    Parameters
+    ----------
+    binary_array : list or array-like
+        Sequence of binary integers (0s and 1s).
+
+    Returns
+    -------
+    int
+        The Lempel-Ziv complexity of the binary array.
+    """
+
+    # convert to bytes for fast iteration
+    binary_array = np.asarray(binary_array)
+    if binary_array.size and not np.isin(binary_array, [0, 1]).all():
+        raise ValueError("binary_array must only contain 0s and 1s")
+    data = binary_array.astype(np.uint8).tobytes()
+
+    # trie[2 * node + c] is the index of the child of 'node' for symbol 'c' 
+    # (0 if the child does not exist; the root is node 0 and is never a child)
+    trie = [0, 0]
+    node = 0
+    for c in data:
+        idx = 2 * node + c
+        child = trie[idx]
+        if child:
+            node = child
+        else:
+            # new phrase - add it to the trie and restart from the root
+            trie[idx] = len(trie) >> 1
+            trie += (0, 0)
+            node = 0
+
+    # number of nodes, excluding the root
+    return (len(trie) >> 1) - 1
+
+
+def lempel_ziv_complexity_reference(binary_array):
+    """
+    Calculate the Lempel-Ziv complexity of a binary array of integers.
+
+    Original implementation, kept as a reference for validating and 
+    benchmarking lempel_ziv_complexity(). Run time grows with the phrase length 
+    as each candidate phrase is rebuilt as a tuple.
+
     Parameters:
         binary_array (list or array-like): A list of binary integers (0s and 1s).
 
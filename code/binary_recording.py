@@ -0,0 +1,254 @@
+"""
+Binary recording format.
+
+Recordings are stored as fixed-size frames (a timestamp followed by one value
+per channel) after a small header, so that samples can be written in blocks
+without text formatting and read back with a memory map.
+
+File layout:
+- bytes 0-7: magic string (b'FGPHYBIN')
+- bytes 8-15: number of frames written (uint64), updated at every flush
+- bytes 16-19: length of the JSON header (uint32)
+- bytes 20-...: JSON header (frame dtype, column names, sampling frequency,
+    capacity and any additional metadata), padded to HEADER_BYTES
+- frames from HEADER_BYTES onwards
+
+Files can be preallocated (capacity frames, written through a memory map) or
+append-only (frames appended to the end of the file). In both cases the frame
+count in the header is only updated after a block of frames has been written,
+so a crash loses at most the frames buffered since the last flush. For
+append-only files, complete frames written after the last count update are
+also recovered by read_binary_recording().
+
+Functions:
+- BinaryRecordingWriter: write frames in blocks
+- read_binary_recording: memory-map the frames of a recording
+- binary_to_csv: convert a recording to CSV
+
+"""
+
+# imports
+import os
+import json
+import numpy as np
+
+MAGIC = b'FGPHYBIN'
+HEADER_BYTES = 4096
+
+
+class BinaryRecordingWriter:
+    """
+    Write a recording as fixed-size binary frames.
+
+    Frames are collected in a preallocated in-memory buffer of block_size
+    frames, which is written to disk (and the buffer reused) whenever it is
+    full, when flush() is called and when the writer is closed.
+
+    Parameters
+    ----------
+    fname : str
+        Output filename.
+    columns : list of str
+        Channel names (the timestamp column is named 'time').
+    fs : float, optional
+        Nominal sampling frequency (Hz), stored in the header.
+    capacity : int, optional
+        Number of frames to preallocate. The file is created at its full size
+        and written through a memory map. If None (default), frames are
+        appended to the file.
+    block_size : int, optional
+        Number of frames buffered between writes, by default 256.
+    dtype : str, optional
+        Data type of the channel values ('<f4' or '<i4'), by default '<f4'.
+    **metadata
+        Additional JSON-serializable values stored in the header.
+
+    Examples
+    --------
+    >>> with BinaryRecordingWriter('rec.bin', ['chan_1', 'chan_2'], fs=250,
+    ...                            capacity=250 * 600) as writer:
+    ...     writer.write(timepoint, values)
+    """
+
+    def __init__(self, fname, columns, fs=None, capacity=None, block_size=256,
+                 dtype='<f4', **metadata):
+        self.fname = fname
+        self.capacity = capacity
+        self.frame_dtype = np.dtype([('time', '<f8'),
+                                     ('data', dtype, (len(columns),))])
+        self.header = dict(metadata, columns=list(columns), fs=fs,
+                           capacity=capacity,
+                           dtype=self.frame_dtype.descr)
+
+        # write header
+        header_json = json.dumps(self.header).encode()
+        if 20 + len(header_json) > HEADER_BYTES:
+            raise ValueError("Header metadata is too large")
+        self._file = open(fname, 'w+b')
+        self._file.write(MAGIC + np.uint64(0).tobytes()
+                         + np.uint32(len(header_json)).tobytes() + header_json)
+        self._file.write(b' ' * (HEADER_BYTES - self._file.tell()))
+
+        # preallocate file and map frames
+        if capacity is not None:
+            self._file.truncate(HEADER_BYTES + capacity * self.frame_dtype.itemsize)
+            self._file.flush()
+            self._frames = np.memmap(self._file, dtype=self.frame_dtype,
+                                     mode='r+', offset=HEADER_BYTES,
+                                     shape=(capacity,))
+
+        # in-memory buffer
+        self._buffer = np.zeros(block_size, dtype=self.frame_dtype)
+        self._n_buffered = 0
+        self.n_frames = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, time, data):
+        """
+        Add one frame (a timestamp and an array of channel values) or a block
+        of frames (an array of timestamps and an array of shape
+        (n_frames, n_channels)).
+        """
+
+        time = np.atleast_1d(time)
+        data = np.asarray(data).reshape(len(time), -1)
+        i_frame = 0
+        while i_frame < len(time):
+            n_copy = min(len(time) - i_frame, len(self._buffer) - self._n_buffered)
+            buffer = self._buffer[self._n_buffered:self._n_buffered + n_copy]
+            buffer['time'] = time[i_frame:i_frame + n_copy]
+            buffer['data'] = data[i_frame:i_frame + n_copy]
+            self._n_buffered += n_copy
+            i_frame += n_copy
+            if self._n_buffered == len(self._buffer):
+                self.flush()
+
+    def flush(self):
+        """Write buffered frames to disk and update the frame count."""
+
+        if self._n_buffered == 0:
+            return
+        frames = self._buffer[:self._n_buffered]
+
+        # write frames
+        if self.capacity is not None:
+            if self.n_frames + len(frames) > self.capacity:
+                raise ValueError("Recording exceeds the preallocated capacity")
+            self._frames[self.n_frames:self.n_frames + len(frames)] = frames
+            self._frames.flush()
+        else:
+            self._file.seek(HEADER_BYTES + self.n_frames * self.frame_dtype.itemsize)
+            self._file.write(frames.tobytes())
+            self._file.flush()
+        self.n_frames += len(frames)
+        self._n_buffered = 0
+
+        # update frame count once the frames are written
+        self._file.seek(len(MAGIC))
+        self._file.write(np.uint64(self.n_frames).tobytes())
+        self._file.flush()
+
+    def close(self):
+        """Flush remaining frames and close the file."""
+
+        if self._file.closed:
+            return
+        self.flush()
+        if self.capacity is not None:
+            del self._frames
+        self._file.close()
+
+
+def read_binary_recording(fname):
+    """
+    Memory-map the frames of a binary recording.
+
+    Only frames counted in the header are returned for preallocated files.
+    For append-only files, all complete frames in the file are returned, which
+    recovers frames written after the last count update (e.g. if the recording
+    crashed).
+
+    Parameters
+    ----------
+    fname : str
+        Filename of the recording.
+
+    Returns
+    -------
+    header : dict
+        JSON header, with 'n_frames' set to the number of frames returned.
+    frames : np.memmap
+        Structured array of frames with fields 'time' and 'data'
+        (n_frames, n_channels).
+    """
+
+    with open(fname, 'rb') as f:
+        prefix = f.read(20)
+        if prefix[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{fname} is not a binary recording")
+        n_frames = int(np.frombuffer(prefix[8:16], dtype=np.uint64)[0])
+        header_length = int(np.frombuffer(prefix[16:20], dtype=np.uint32)[0])
+        header = json.loads(f.read(header_length))
+
+    frame_dtype = np.dtype([tuple(field) for field in header['dtype']])
+    if header['capacity'] is None:
+        # the file size, not the header count, is authoritative: frames may
+        # have been written after the last count update, or lost at the end of
+        # the file after a power failure
+        n_frames = max(0, (os.path.getsize(fname) - HEADER_BYTES)
+                       // frame_dtype.itemsize)
+    header['n_frames'] = n_frames
+
+    if n_frames == 0:
+        return header, np.zeros(0, dtype=frame_dtype)
+    frames = np.memmap(fname, dtype=frame_dtype, mode='r', offset=HEADER_BYTES,
+                       shape=(n_frames,))
+
+    return header, frames
+
+
+def binary_to_csv(fname, fname_out, chunk_size=2**16):
+    """
+    Convert a binary recording to CSV (a 'time' column and one column per
+    channel), in chunks of frames.
+
+    Rows are written in the format of the PiEEG CSV recordings (see
+    pieeg_acquisition.CsvSink): time with 6 decimals and voltages with 2
+    decimals. Recordings of integer values (e.g. raw ADC counts) are written
+    as integers, without loss.
+
+    Parameters
+    ----------
+    fname : str
+        Filename of the binary recording.
+    fname_out : str
+        Output CSV filename.
+    chunk_size : int, optional
+        Number of frames converted at a time, by default 2**16.
+
+    Returns
+    -------
+    n_frames : int
+        Number of frames converted.
+    """
+
+    header, frames = read_binary_recording(fname)
+    n_channels = len(header['columns'])
+    if np.issubdtype(frames.dtype['data'].base, np.integer):
+        fmt = ['%.6f'] + ['%d'] * n_channels
+    else:
+        fmt = ['%.6f'] + ['%.2f'] * n_channels
+
+    with open(fname_out, 'w') as f:
+        f.write(','.join(['time'] + header['columns']) + '\n')
+        for i_start in range(0, len(frames), chunk_size):
+            chunk = frames[i_start:i_start + chunk_size]
+            table = np.column_stack([chunk['time'], chunk['data']])
+            np.savetxt(f, table, fmt=fmt, delimiter=', ')
+
+    return len(frames)
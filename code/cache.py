@@ -0,0 +1,270 @@
+"""
+On-disk caches.
+
+- FitCache: content-addressed cache for fit results. Results are stored as .npy 
+    files named by a hash of the input arrays and fit parameters, so only 
+    changed inputs are refit. The cache is bounded in size; when it grows beyond 
+    max_bytes the least recently used entries are evicted.
+- Sidecar caches for parsed text files (load_sidecar, save_sidecar, 
+    read_csv_cached): parsed data are stored next to the source file as a 
+    memory-mappable .npy file, keyed on the size and modification time of the 
+    source, so repeated loads skip parsing.
+
+"""
+
+# imports
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+import sys
+sys.path.append("code")
+from settings import CACHE_DIR, CACHE_MAX_BYTES
+
+
+class FitCache:
+    """
+    Size-bounded, least-recently-used cache of arrays on disk.
+
+    Parameters
+    ----------
+    path : str, optional
+        Cache directory, by default CACHE_DIR.
+    max_bytes : int, optional
+        Maximum total size of cached results, by default CACHE_MAX_BYTES.
+
+    Examples
+    --------
+    >>> cache = FitCache()
+    >>> key = cache.make_key(spectra, freqs, ap_mode='knee')
+    >>> exponent = cache.get(key)
+    >>> if exponent is None:
+    ...     exponent = fit(spectra, freqs)
+    ...     cache.set(key, exponent)
+    """
+
+    def __init__(self, path=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def make_key(self, *arrays, **params):
+        """
+        Hash input arrays (content, shape and dtype) and parameters.
+
+        Parameters are serialized with json (falling back to repr), so they 
+        must have a stable representation.
+        """
+
+        hasher = hashlib.sha256()
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            hasher.update(f"{array.shape}{array.dtype.str}".encode())
+            hasher.update(array)
+        hasher.update(json.dumps(params, sort_keys=True, default=repr).encode())
+
+        return hasher.hexdigest()
+
+    def get(self, key):
+        """Return the cached array for key, or None if it is not cached."""
+
+        fname = self._fname(key)
+        try:
+            value = np.load(fname)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        # mark as recently used
+        os.utime(fname)
+
+        return value
+
+    def set(self, key, value):
+        """Store an array under key and evict old entries if needed."""
+
+        fname = self._fname(key)
+        with open(f"{fname}.tmp", 'wb') as f:
+            np.save(f, np.asarray(value))
+        os.replace(f"{fname}.tmp", fname)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until within max_bytes."""
+
+        entries = []
+        for fname in os.listdir(self.path):
+            if fname.endswith('.npy'):
+                stat = os.stat(os.path.join(self.path, fname))
+                entries.append((stat.st_mtime, stat.st_size, fname))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, fname in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.path, fname))
+            total -= size
+
+    def clear(self):
+        """Remove all entries."""
+
+        for fname in os.listdir(self.path):
+            if fname.endswith('.npy'):
+                os.remove(os.path.join(self.path, fname))
+
+    def _fname(self, key):
+        return os.path.join(self.path, f"{key}.npy")
+
+
+def get_cache(cache):
+    """
+    Convert a cache argument into a FitCache (or None).
+
+    Parameters
+    ----------
+    cache : bool, str or FitCache
+        False/None disables caching, True uses the default cache directory, a 
+        string is used as the cache directory.
+    """
+
+    if cache is None or cache is False:
+        return None
+    elif cache is True:
+        return FitCache()
+    elif isinstance(cache, str):
+        return FitCache(cache)
+    else:
+        return cache
+
+
+def load_sidecar(fname, params=None):
+    """
+    Load the binary sidecar cache of a source file, if it is up to date.
+
+    The sidecar consists of '<fname>.cache.npy' (memory-mapped on load) and 
+    '<fname>.cache.json', which records the size and modification time of the 
+    source file and the parameters used to parse it. The cache is invalid if 
+    the source file has changed (e.g. grown) or was parsed differently.
+
+    Parameters
+    ----------
+    fname : str
+        Source filename.
+    params : dict, optional
+        Parameters used to parse the source file.
+
+    Returns
+    -------
+    array : np.memmap or None
+        Cached array (read-only), or None if there is no valid cache.
+    meta : dict or None
+        Metadata stored with the array (see save_sidecar).
+    """
+
+    try:
+        with open(f"{fname}.cache.json", 'r') as f:
+            meta = json.load(f)
+        if meta['source'] != get_source_stat(fname) or \
+                meta['params'] != _to_json(params):
+            return None, None
+        array = np.load(f"{fname}.cache.npy", mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+    return array, meta
+
+
+def save_sidecar(fname, array, source, params=None, **meta):
+    """
+    Save an array parsed from a source file as its binary sidecar cache.
+
+    The source file must be stat'ed (get_source_stat) before it is parsed: if 
+    it changed while being parsed (e.g. a recording in progress), the parsed 
+    data do not match the file and no sidecar is written. Failures to write 
+    (e.g. a read-only data directory) are ignored, as the cache is only an 
+    optimization.
+
+    Parameters
+    ----------
+    fname : str
+        Source filename.
+    array : np.array
+        Parsed data.
+    source : list
+        Size and modification time of the source file before it was parsed, 
+        as returned by get_source_stat.
+    params : dict, optional
+        Parameters used to parse the source file.
+    **meta
+        Additional JSON-serializable metadata (e.g. column names).
+    """
+
+    if get_source_stat(fname) != source:
+        return
+    meta = dict(meta, source=source, params=_to_json(params))
+    try:
+        with open(f"{fname}.cache.npy.tmp", 'wb') as f:
+            np.save(f, np.asarray(array))
+        os.replace(f"{fname}.cache.npy.tmp", f"{fname}.cache.npy")
+        with open(f"{fname}.cache.json", 'w') as f:
+            json.dump(meta, f)
+    except OSError:
+        pass
+
+
+def read_csv_cached(fname, cache=True, **kwargs):
+    """
+    Read a numeric CSV file, using a binary sidecar cache for repeated loads.
+
+    On the first load the CSV is parsed with pandas.read_csv and saved as a 
+    sidecar (see save_sidecar); later loads memory-map the sidecar instead of 
+    parsing the text, until the CSV changes. Both paths return the same 
+    float64 frame. Files with non-numeric columns are not cached and are 
+    returned as parsed by pandas.
+
+    Parameters
+    ----------
+    fname : str
+        CSV filename.
+    cache : bool, optional
+        Whether to use the sidecar cache, by default True.
+    **kwargs
+        Passed to pandas.read_csv.
+
+    Returns
+    -------
+    pd.DataFrame
+        CSV data (float64 if all columns are numeric).
+    """
+
+    if cache:
+        array, meta = load_sidecar(fname, kwargs)
+        if array is not None:
+            return pd.DataFrame(array, columns=meta['columns'], copy=False)
+
+    source = get_source_stat(fname)
+    df = pd.read_csv(fname, **kwargs)
+    if not cache or not all(pd.api.types.is_numeric_dtype(dtype) 
+                            for dtype in df.dtypes):
+        return df
+
+    array = df.to_numpy(dtype=float)
+    columns = df.columns.to_list()
+    save_sidecar(fname, array, source, kwargs, columns=columns)
+
+    return pd.DataFrame(array, columns=columns, copy=False)
+
+
+def get_source_stat(fname):
+    """Size and modification time identifying the state of a source file."""
+
+    stat = os.stat(fname)
+
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _to_json(params):
+    """Round-trip parameters through JSON so they compare equal once loaded."""
+
+    return json.loads(json.dumps(params, sort_keys=True, default=repr))
@@ -0,0 +1,451 @@
+"""
+Streaming acquisition from the PicoLog ADC-24 data logger.
+
+Instead of requesting one conversion at a time (HRDLGetSingleValue), the logger
+is run in streaming mode (HRDLSetInterval, HRDLRun with the BM_STREAM method):
+it samples on its own clock, and the values collected since the last call are
+read in blocks with HRDLGetValues directly into a preallocated NumPy buffer.
+
+The PicoHRDL driver is passed in as an object exposing the HRDL* functions, so
+that picosdk is only imported when recording from the device (get_hrdl()).
+FakeHRDL implements the same functions with a simulated signal, for testing
+without the device:
+
+    logger = PicoLogStream(FakeHRDL(), channels=[1, 3], voltage_range=39, dt=200)
+    with logger:
+        for chunk in logger.iter_chunks(n_samples=6000, chunk_size=300):
+            voltage = logger.to_voltage(chunk) # (n_channels, n_samples)
+
+Long recordings are written incrementally to an append-only binary recording
+(see binary_recording.py) by record_to_binary(): ADC counts are flushed after
+every chunk, with the channels, voltage ranges, sampling interval and scaling
+in the header, so memory use is bounded and a crash loses at most one chunk.
+recording_to_txt() converts a recording (complete or not) to text.
+
+"""
+
+# imports
+import os
+import ctypes
+from time import monotonic, sleep
+import numpy as np
+
+import sys
+sys.path.append("code")
+from binary_recording import BinaryRecordingWriter, read_binary_recording
+
+# HRDL enumerations
+VOLTAGE_RANGES = {2500: 0, 1250: 1, 625: 2, 313: 3, 156: 4, 78: 5, 39: 6} # mV
+CONVERSION_TIMES = {60: 0, 100: 1, 180: 2, 340: 3, 660: 4} # ms
+BM_BLOCK, BM_WINDOW, BM_STREAM = 0, 1, 2
+
+
+def get_hrdl():
+    """Import the PicoHRDL driver (picosdk)."""
+    from picosdk.picohrdl import picohrdl as hrdl
+
+    return hrdl
+
+
+class PicoLogStream:
+    """
+    Record one or more differential channels of a PicoLog ADC-24 in streaming
+    mode.
+
+    All channels are sampled in the same acquisition pass: the logger converts
+    each enabled channel in turn within every sampling interval, and
+    HRDLGetValues returns the values interleaved by channel.
+
+    Parameters
+    ----------
+    hrdl : object
+        PicoHRDL driver (get_hrdl()) or FakeHRDL.
+    channels : int or list of int
+        Odd-numbered channel of each differential pair (channel and
+        channel+1). Channels are recorded in ascending order.
+    voltage_range : int or list of int, optional
+        Voltage range (mV) of all channels or of each channel, by default 39.
+    dt : int, optional
+        Sampling interval (ms), by default 100.
+    conversion_time : int, optional
+        Conversion time of each channel (ms). By default, the longest
+        conversion time for which all channels fit in the sampling interval
+        (dt for a single channel, if valid).
+    vmax : float or list of float, optional
+        Voltage (uV) corresponding to the maximum ADC count, given like
+        voltage_range (a single value, or one value per channel), by default
+        voltage_range * 1000.
+    mains_60hz : bool, optional
+        Reject 60 Hz rather than 50 Hz mains noise, by default False.
+    driver_buffer : int, optional
+        Number of samples buffered by the driver between reads, by default
+        1000.
+
+    Attributes
+    ----------
+    max_adc : np.array
+        Maximum ADC count of each channel (HRDLGetMinMaxAdcCounts).
+    n_overflows : int
+        Number of reads in which the input exceeded the voltage range.
+    """
+
+    def __init__(self, hrdl, channels, voltage_range=39, dt=100,
+                 conversion_time=None, vmax=None, mains_60hz=False,
+                 driver_buffer=1000):
+        channels = np.atleast_1d(channels)
+        n_channels = len(channels)
+        if np.any(channels % 2 == 0):
+            raise ValueError("Channels must be the odd-numbered channel of each "
+                             "differential pair")
+
+        # per-channel voltage range and scaling, in ascending channel order
+        order = np.argsort(channels)
+        self.channels = channels[order].tolist()
+        if vmax is not None and np.size(vmax) != np.size(voltage_range):
+            raise ValueError("vmax must have one value per voltage range")
+        voltage_range = np.broadcast_to(voltage_range, n_channels)[order]
+        for range_ in voltage_range:
+            if range_ not in VOLTAGE_RANGES:
+                raise ValueError(f"Voltage range must be one of {list(VOLTAGE_RANGES)} mV")
+        self.voltage_range = voltage_range.tolist()
+        if vmax is None:
+            vmax = np.multiply(voltage_range, 1000)
+        else:
+            vmax = np.broadcast_to(vmax, n_channels)[order]
+        self.vmax = np.asarray(vmax, dtype=float).tolist()
+
+        # conversion time of each channel within the sampling interval
+        if conversion_time is None:
+            valid = [time for time in CONVERSION_TIMES if time * n_channels <= dt]
+            if not valid:
+                raise ValueError(f"dt must be at least {min(CONVERSION_TIMES)} ms "
+                                 f"per channel ({n_channels} channels)")
+            conversion_time = max(valid)
+        if conversion_time not in CONVERSION_TIMES:
+            raise ValueError(f"Conversion time must be one of {list(CONVERSION_TIMES)} ms")
+        if conversion_time * n_channels > dt:
+            raise ValueError(f"dt must be at least {conversion_time * n_channels} "
+                             f"ms for {n_channels} channels")
+
+        self.hrdl = hrdl
+        self.dt = dt
+        self.fs = 1000 / dt
+        self.conversion_time = conversion_time
+        self.mains_60hz = mains_60hz
+        self.driver_buffer = driver_buffer
+        self.handle = None
+        self.max_adc = None
+        self.n_overflows = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        """Open the logger and configure the channels and sampling interval."""
+
+        self.handle = self.hrdl.HRDLOpenUnit()
+        _check(self.handle, "HRDLOpenUnit")
+        _check(self.hrdl.HRDLSetMains(self.handle, int(self.mains_60hz)),
+               "HRDLSetMains")
+
+        max_adc = []
+        for channel, voltage_range in zip(self.channels, self.voltage_range):
+            # differential recording: disable the even-numbered channel of the pair
+            range_ = VOLTAGE_RANGES[voltage_range]
+            self.hrdl.HRDLSetAnalogInChannel(self.handle, channel + 1, 0, range_, 0)
+            _check(self.hrdl.HRDLSetAnalogInChannel(self.handle, channel, 1,
+                                                    range_, 0),
+                   "HRDLSetAnalogInChannel")
+
+            # ADC counts for voltage scaling
+            min_value, max_value = ctypes.c_int32(), ctypes.c_int32()
+            self.hrdl.HRDLGetMinMaxAdcCounts(self.handle, ctypes.byref(min_value),
+                                             ctypes.byref(max_value), channel)
+            max_adc.append(max_value.value)
+        self.max_adc = np.array(max_adc)
+
+        _check(self.hrdl.HRDLSetInterval(self.handle, self.dt,
+                                         CONVERSION_TIMES[self.conversion_time]),
+               "HRDLSetInterval")
+
+    def close(self):
+        """Stop sampling and close the logger."""
+
+        if self.handle is None:
+            return
+        self.hrdl.HRDLStop(self.handle)
+        self.hrdl.HRDLCloseUnit(self.handle)
+        self.handle = None
+
+    def iter_chunks(self, n_samples, chunk_size=300):
+        """
+        Stream n_samples samples of all channels, in chunks of chunk_size
+        samples.
+
+        Parameters
+        ----------
+        n_samples : int
+            Number of samples to record (per channel).
+        chunk_size : int, optional
+            Number of samples per chunk, by default 300. The last chunk may be
+            shorter.
+
+        Yields
+        ------
+        chunk : np.array
+            ADC counts (int32) of shape (n_channels, n_samples). The buffer is
+            reused for the next chunk, so it must be copied or written before
+            continuing.
+        """
+
+        # values are interleaved by channel: one row per sample
+        buffer = np.zeros((chunk_size, len(self.channels)), dtype=np.int32)
+        overflow = ctypes.c_int16(0)
+
+        _check(self.hrdl.HRDLRun(self.handle, self.driver_buffer, BM_STREAM),
+               "HRDLRun")
+        try:
+            n_recorded = 0
+            while n_recorded < n_samples:
+                # fill the chunk buffer with the values available
+                n_chunk = min(chunk_size, n_samples - n_recorded)
+                n_filled = 0
+                while n_filled < n_chunk:
+                    values = buffer[n_filled:n_chunk]
+                    n_values = self.hrdl.HRDLGetValues(
+                        self.handle,
+                        values.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),
+                        ctypes.byref(overflow), len(values))
+                    if n_values < 0:
+                        raise RuntimeError("HRDLGetValues failed")
+                    if overflow.value:
+                        self.n_overflows += 1
+                    n_filled += n_values
+
+                    # wait for the logger to collect more samples
+                    if n_filled < n_chunk:
+                        sleep(min(n_chunk - n_filled, self.driver_buffer // 2)
+                              * self.dt / 1000)
+
+                n_recorded += n_chunk
+                yield buffer[:n_chunk].T
+        finally:
+            self.hrdl.HRDLStop(self.handle)
+
+    def to_voltage(self, counts):
+        """Convert ADC counts (n_channels, n_samples) to voltage (uV)."""
+
+        scale = np.array(self.vmax) / self.max_adc
+
+        return counts * scale[:, np.newaxis]
+
+
+def record_to_binary(logger, fname, n_samples, chunk_size=300, **metadata):
+    """
+    Record from an open logger to an append-only binary recording, flushing
+    the ADC counts after every chunk (one column per channel).
+
+    Parameters
+    ----------
+    logger : PicoLogStream
+        Open logger.
+    fname : str
+        Output filename of the binary recording.
+    n_samples : int
+        Number of samples to record.
+    chunk_size : int, optional
+        Number of samples read and written at a time, by default 300.
+    **metadata
+        Additional values stored in the header.
+
+    Returns
+    -------
+    n_frames : int
+        Number of samples written.
+    """
+
+    header = dict(metadata, channels=logger.channels,
+                  voltage_range=logger.voltage_range, dt=logger.dt,
+                  conversion_time=logger.conversion_time, vmax=logger.vmax,
+                  max_adc=logger.max_adc.tolist())
+    columns = [f"channel_{channel}" for channel in logger.channels]
+    with BinaryRecordingWriter(fname, columns, fs=logger.fs,
+                               block_size=chunk_size, dtype='<i4',
+                               **header) as writer:
+        i_sample = 0
+        for chunk in logger.iter_chunks(n_samples, chunk_size):
+            time = (i_sample + np.arange(chunk.shape[1])) / logger.fs
+            writer.write(time, chunk.T)
+            writer.flush()
+            i_sample += chunk.shape[1]
+
+    return writer.n_frames
+
+
+def recording_to_txt(fname, fname_out, n_drop=None, chunk_size=2**16):
+    """
+    Convert a binary PicoLog recording to a text file of voltages (uV), one
+    sample per line (one comma-separated column per channel), as saved by
+    picolog_recording_continuous.py.
+
+    Parameters
+    ----------
+    fname : str
+        Filename of the binary recording (see record_to_binary()).
+    fname_out : str
+        Output text filename.
+    n_drop : int, optional
+        Number of samples to drop from the beginning of the recording, by
+        default the 'n_drop' value in the header (or 0).
+    chunk_size : int, optional
+        Number of samples converted at a time, by default 2**16.
+
+    Returns
+    -------
+    n_samples : int
+        Number of samples written.
+    """
+
+    # opening the output would truncate the recording
+    if os.path.realpath(fname_out) == os.path.realpath(fname):
+        raise ValueError("fname_out must differ from the binary recording")
+
+    header, frames = read_binary_recording(fname)
+    if n_drop is None:
+        n_drop = header.get('n_drop', 0)
+    scale = np.divide(header['vmax'], header['max_adc'])
+
+    with open(fname_out, 'w') as f:
+        for i_start in range(n_drop, len(frames), chunk_size):
+            counts = frames['data'][i_start:i_start + chunk_size]
+            np.savetxt(f, counts * scale, delimiter=',')
+
+    return max(len(frames) - n_drop, 0)
+
+
+def _check(status, name):
+    """Raise an error if a PicoHRDL function failed (status <= 0)."""
+
+    if status <= 0:
+        raise RuntimeError(f"{name} failed (status {status})")
+
+
+class FakeHRDL:
+    """
+    Simulated PicoHRDL driver: a sine wave with noise on every enabled
+    channel.
+
+    Parameters
+    ----------
+    max_adc : int, optional
+        Maximum ADC count, by default 2**23 - 1.
+    amplitude : float, optional
+        Amplitude of the sine wave (fraction of max_adc), by default 0.1.
+    frequency : float, optional
+        Frequency of the sine wave (Hz), by default 0.05.
+    realtime : bool, optional
+        If True, samples become available at the sampling interval; otherwise
+        HRDLGetValues returns values immediately.
+    seed : int, optional
+        Random seed.
+    """
+
+    def __init__(self, max_adc=2**23 - 1, amplitude=0.1, frequency=0.05,
+                 realtime=False, seed=None):
+        self.max_adc = max_adc
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.realtime = realtime
+        self.rng = np.random.default_rng(seed)
+        self.channels = {}
+        self.interval = None
+        self.running = False
+        self.n_calls = {}
+
+    def _count(self, name):
+        self.n_calls[name] = self.n_calls.get(name, 0) + 1
+
+    def HRDLOpenUnit(self):
+        self._count('HRDLOpenUnit')
+        return 1
+
+    def HRDLSetMains(self, handle, sixty_hertz):
+        self._count('HRDLSetMains')
+        return 1
+
+    def HRDLSetAnalogInChannel(self, handle, channel, enabled, range_, single_ended):
+        self._count('HRDLSetAnalogInChannel')
+        if enabled:
+            self.channels[channel] = range_
+        else:
+            self.channels.pop(channel, None)
+        return 1
+
+    def HRDLGetMinMaxAdcCounts(self, handle, min_value, max_value, channel):
+        self._count('HRDLGetMinMaxAdcCounts')
+        _deref(min_value).value = -self.max_adc
+        _deref(max_value).value = self.max_adc
+        return 1
+
+    def HRDLSetInterval(self, handle, interval, conversion_time):
+        self._count('HRDLSetInterval')
+        self.interval = interval / 1000
+        return 1
+
+    def HRDLRun(self, handle, n_values, method):
+        self._count('HRDLRun')
+        self.running = True
+        self.t_run = monotonic()
+        self.n_delivered = 0
+        return 1
+
+    def HRDLReady(self, handle):
+        self._count('HRDLReady')
+        return int(self.running)
+
+    def HRDLGetValues(self, handle, values, overflow, n_values):
+        """Write up to n_values samples per channel, interleaved by channel."""
+
+        self._count('HRDLGetValues')
+        if not self.running:
+            return 0
+        if self.realtime:
+            n_available = int((monotonic() - self.t_run) / self.interval) \
+                - self.n_delivered
+            n_values = max(0, min(n_values, n_available))
+
+        # simulated signal, phase-shifted across the channels (in ascending
+        # order, as returned by the driver)
+        n_channels = len(self.channels)
+        time = (self.n_delivered + np.arange(n_values)) * self.interval
+        phase = np.pi * np.arange(n_channels) / max(n_channels, 1)
+        signal = self.amplitude * np.sin(2 * np.pi * self.frequency * time[:, None]
+                                         + phase)
+        counts = self.max_adc * (signal + 0.01 * \
+            self.rng.standard_normal((n_values, n_channels)))
+        counts = counts.astype(np.int32).ravel()
+        for i_value, value in enumerate(counts):
+            values[i_value] = int(value)
+        _deref(overflow).value = 0
+        self.n_delivered += n_values
+
+        return n_values
+
+    def HRDLStop(self, handle):
+        self._count('HRDLStop')
+        self.running = False
+        return 1
+
+    def HRDLCloseUnit(self, handle):
+        self._count('HRDLCloseUnit')
+        return 1
+
+
+def _deref(pointer):
+    """Get the ctypes object referenced by byref() or pointer()."""
+
+    return pointer._obj if hasattr(pointer, '_obj') else pointer.contents
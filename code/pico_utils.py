@@ -8,50 +8,168 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 from time_utils import convert_seconds
+from cache import load_sidecar, save_sidecar, get_source_stat
 
 
 def import_data(fname, ch_names=None, zero_nan=True, return_labels=False,
-               end_time=None, verbose=True):
+               end_time=None, verbose=True, engine=None, cache=True):
+    """
+    Import a PicoLog CSV recording.
+
+    The first column holds the time of day of each sample (HH:MM:SS, possibly 
+    preceded by a date); it is converted to seconds without creating Python 
+    datetime objects (see parse_time_of_day), and recordings spanning midnight 
+    are handled.
+
+    Parameters
+    ----------
+    fname : str
+        CSV filename.
+    ch_names : list of str, optional
+        Column names (including the time column). If given, the header row of 
+        the file is replaced.
+    zero_nan : bool, optional
+        Set NaN values to zero, by default True.
+    return_labels : bool, optional
+        Also return the channel labels, by default False.
+    end_time : float, optional
+        Drop samples after this time (s), e.g. trailing rows of NaN.
+    verbose : bool, optional
+        Print information about the recording, by default True.
+    engine : str, optional
+        CSV parser passed to pandas.read_csv, e.g. 'pyarrow' (faster for large 
+        files if pyarrow is installed). Defaults to the pandas C parser.
+
+    Returns
+    -------
+    signals : np.array
+        Signals of shape (n_channels, n_samples).
+    time : np.array
+        Time of each sample (s).
+    labels : pd.Index
+        Channel labels (if return_labels is True).
+    """
+
+    # load parsed data from the sidecar cache
+    array, meta = load_sidecar(fname, {'ch_names': ch_names}) if cache else (None, None)
+    if array is not None:
+        time, signals = np.array(array[0]), np.array(array[1:])
+        labels = pd.Index(meta['labels'])
 
-    # import data
-    if ch_names is None:
-        df = pd.read_csv(fname)
     else:
-        df = pd.read_csv(fname, skiprows=1, names=ch_names)
+        # import data, keeping the time column as text
+        source = get_source_stat(fname)
+        if ch_names is None:
+            time_col = pd.read_csv(fname, nrows=0).columns[0]
+            df = pd.read_csv(fname, dtype={time_col: str}, engine=engine)
+        else:
+            time_col = ch_names[0]
+            df = pd.read_csv(fname, skiprows=1, names=ch_names, 
+                             dtype={time_col: str}, engine=engine)
+
+        # convert HH:MM:SS to seconds
+        time = parse_time_of_day(df[time_col])
+        labels = df.columns[1:]
+        signals = df[labels].to_numpy(dtype=float).T
 
-    # convert HH:MM:SS to seconds
-    df = df.rename(columns={df.columns[0]: 'time'})
-    df['time'] = pd.to_datetime(df['time']).dt.time
-    df['time'] = pd.to_timedelta(df['time'].astype(str)).dt.total_seconds()
+        if cache:
+            save_sidecar(fname, np.vstack([time, signals]), source,
+                         {'ch_names': ch_names}, labels=labels.to_list())
 
     # drop end of signal (trailing rows of NaN)
     if end_time is not None:
-        df = df.loc[df['time'] <= end_time]
+        keep = time <= end_time
+        time, signals = time[keep], signals[:, keep]
 
     # print info
     if verbose:
-        total_time = df['time'].iloc[-1] - df['time'].iloc[0]
+        total_time = time[-1] - time[0]
         day, hour, min, sec = convert_seconds(total_time)
         print(f"\tFilename: {fname}")
         print(f"\tDuration: {day} days, {hour} hours, {min} minutes, {sec} seconds")
-        print(f"\tColumns: {df.columns.to_list()}")
+        print(f"\tColumns: {['time'] + labels.to_list()}")
 
-    # set nan to 0
+    # set nan to 0 (in place, counting NaNs from the same mask)
     if zero_nan:
+        nan_mask = np.isnan(signals)
         if verbose:
-            n_nan = df.isna().sum().sum()
-            total_values = df.shape[0] * df.shape[1]
+            n_nan = nan_mask.sum() + np.isnan(time).sum()
+            total_values = time.size + signals.size
             perc = n_nan / total_values * 100
             print(f"\tCleaning: {n_nan} NaN values were set to zero ({perc:0.0f}%)")
-        df = df.fillna(0)
-
-    # convert to numpy
-    signals = df.iloc[:, 1:].to_numpy().T
-    time = df['time'].to_numpy()
-    labels = df.columns[1:]
+        signals[nan_mask] = 0
+        time = np.nan_to_num(time)
 
     # return
     if return_labels:
         return signals, time, labels
     else:
         return signals, time
+
+
+def parse_time_of_day(times):
+    """
+    Convert time-of-day strings (HH:MM:SS) to seconds.
+
+    Strings ending in a fixed-width HH:MM:SS (optionally preceded by a date, 
+    all of the same length) are decoded directly from their bytes. Other 
+    formats (e.g. H:MM:SS or fractional seconds) are parsed with a single 
+    vectorized regular expression, and strings it does not match (e.g. 12-hour 
+    times) with pandas.to_datetime, which raises if they cannot be parsed. 
+    Whenever the time of day goes back by more than 12 hours, a day is added, 
+    so recordings spanning midnight increase monotonically; smaller backward 
+    steps (e.g. clock adjustments) are kept as they are.
+
+    Parameters
+    ----------
+    times : pd.Series or array-like of str
+        Time-of-day strings. Missing values are returned as NaN.
+
+    Returns
+    -------
+    seconds : np.array
+        Time of each sample (s).
+    """
+
+    times = pd.Series(times, dtype=object)
+    missing = times.isna().to_numpy()
+    strings = times.fillna('').str.strip().to_numpy(dtype=str)
+
+    if len(strings) == 0:
+        return np.zeros(0)
+
+    # fast path: fixed-width strings ending in HH:MM:SS
+    lengths = np.char.str_len(strings)
+    width = lengths.max()
+    fixed_width = width >= 8 and np.all(lengths[~missing] == width)
+    if fixed_width:
+        chars = strings.astype(f'S{width}').view(np.uint8).reshape(-1, width)
+        digits = chars[~missing][:, [-8, -7, -5, -4, -2, -1]]
+        fixed_width = np.all(chars[~missing][:, [-6, -3]] == ord(':')) and \
+            np.all((digits >= ord('0')) & (digits <= ord('9')))
+    if fixed_width:
+        digits = chars[:, -8:].astype(np.int64) - ord('0')
+        seconds = (3600 * (10 * digits[:, 0] + digits[:, 1]) 
+                   + 60 * (10 * digits[:, 3] + digits[:, 4]) 
+                   + 10 * digits[:, 6] + digits[:, 7]).astype(float)
+
+    # general path
+    else:
+        parts = pd.Series(strings).str.extract(
+            r'(\d{1,2}):(\d{2}):(\d{2}(?:\.\d*)?)$').astype(float)
+        seconds = (3600 * parts[0] + 60 * parts[1] + parts[2]).to_numpy(copy=True)
+
+        # other formats (e.g. 12-hour clock): parse with pandas
+        unmatched = np.isnan(seconds) & ~missing
+        if np.any(unmatched):
+            datetimes = pd.to_datetime(pd.Series(strings[unmatched]))
+            seconds[unmatched] = (datetimes - datetimes.dt.normalize()) \
+                .dt.total_seconds().to_numpy()
+    seconds[missing] = np.nan
+
+    # handle midnight rollover
+    valid = ~np.isnan(seconds)
+    rollover = np.zeros(len(seconds))
+    rollover[valid] = 86400 * np.cumsum(np.diff(seconds[valid], prepend=0) < -43200)
+
+    return seconds + rollover
@@ -0,0 +1,475 @@
+"""
+Acquisition engine for the PiEEG-16.
+
+SPI reads, decoding and disk writes are split across two threads, so that disk
+latency does not delay sampling:
+
+- a reader thread paces acquisition with a monotonic clock, reads raw frames
+  from both ADS1299 chips and pushes them, with their timestamps, into a ring
+  buffer;
+- a writer thread drains the ring buffer in batches, decodes the batch with
+  pieeg_utils.decode_frames() and passes it to a sink (e.g.
+  BinaryRecordingWriter.write or CsvSink.write).
+
+The ring buffer has a single producer and a single consumer, each of which only
+advances its own index, so no lock is needed. If the writer falls behind and
+the buffer is full, new frames are dropped and counted as overruns.
+
+By default the reader paces reads with the sampling frequency. With a
+DrdyFrameReader, the reader instead waits for the falling edge of the ADS1299
+DRDY (data ready) line, so that every conversion is read exactly once, at the
+chip's data rate, and each sample is timestamped with the time of its edge.
+
+Simulated SPI devices and GPIO lines are provided for testing without the hardware:
+
+    spi_1, spi_2, cs_line = SimulatedSpi(), SimulatedSpi(), SimulatedLine()
+    engine = AcquisitionEngine(SpiFrameReader(spi_1, spi_2, cs_line), sink, fs=250)
+    engine.run(duration=10)
+
+    drdy_line = SimulatedDrdyLine(fs=250)
+    reader = DrdyFrameReader(spi_1, spi_2, cs_line, drdy_line)
+    engine = AcquisitionEngine(reader, sink, fs=250)
+
+"""
+
+# imports
+import threading
+from time import monotonic, sleep
+from types import SimpleNamespace
+import numpy as np
+
+import sys
+sys.path.append("code")
+from pieeg_utils import decode_frames, FRAME_BYTES
+
+
+class RingBuffer:
+    """
+    Single-producer, single-consumer ring buffer of raw frames and timestamps.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of frames held.
+    frame_bytes : int
+        Size of each frame (bytes).
+    """
+
+    def __init__(self, capacity, frame_bytes):
+        self.capacity = capacity
+        self.frames = np.zeros((capacity, frame_bytes), dtype=np.uint8)
+        self.times = np.zeros(capacity)
+
+        # total number of frames written and read; only the producer advances
+        # write_index and only the consumer advances read_index
+        self.write_index = 0
+        self.read_index = 0
+        self.n_overruns = 0
+
+    def __len__(self):
+        return self.write_index - self.read_index
+
+    def push(self, frame, time):
+        """Add a frame (producer). Returns False if the buffer is full."""
+
+        if self.write_index - self.read_index >= self.capacity:
+            self.n_overruns += 1
+            return False
+
+        slot = self.write_index % self.capacity
+        self.frames[slot] = frame
+        self.times[slot] = time
+
+        # publish the frame only once it has been written
+        self.write_index += 1
+
+        return True
+
+    def pop(self, max_frames=None):
+        """Remove and return all available frames, up to max_frames (consumer)."""
+
+        n_frames = self.write_index - self.read_index
+        if max_frames is not None:
+            n_frames = min(n_frames, max_frames)
+        slots = (self.read_index + np.arange(n_frames)) % self.capacity
+        frames, times = self.frames[slots], self.times[slots]
+
+        # release the slots once they have been copied
+        self.read_index += n_frames
+
+        return frames, times
+
+
+class SpiFrameReader:
+    """
+    Read one raw frame from each chip of the PiEEG-16.
+
+    Parameters
+    ----------
+    spi_1, spi_2 : spidev.SpiDev
+        SPI devices of the two chips, as returned by setup_pieeg16().
+    cs_line : gpiod line
+        Chip select line of the second chip.
+    """
+
+    frame_bytes = 2 * FRAME_BYTES
+
+    # reads are paced by the engine
+    clocked = False
+
+    def __init__(self, spi_1, spi_2, cs_line):
+        self.spi_1 = spi_1
+        self.spi_2 = spi_2
+        self.cs_line = cs_line
+
+    def read(self):
+        """Return the concatenated frames of both chips (54 bytes)."""
+
+        output_1 = self.spi_1.readbytes(FRAME_BYTES)
+        self.cs_line.set_value(0)
+        output_2 = self.spi_2.readbytes(FRAME_BYTES)
+        self.cs_line.set_value(1)
+
+        return output_1 + output_2
+
+
+class DrdyFrameReader(SpiFrameReader):
+    """
+    Read one raw frame from each chip of the PiEEG-16 per conversion, on the
+    falling edge of the DRDY line.
+
+    The DRDY line must be requested for falling edge events (gpiod v1 API, see
+    pieeg_utils.setup_drdy_line()). If more than one edge is pending when a
+    read starts, the reader has fallen behind: only the latest conversion is
+    available from the chip, so it is read and the earlier edges are counted
+    as missed conversions.
+
+    Parameters
+    ----------
+    spi_1, spi_2 : spidev.SpiDev
+        SPI devices of the two chips, as returned by setup_pieeg16().
+    cs_line : gpiod line
+        Chip select line of the second chip.
+    drdy_line : gpiod line
+        DRDY line, requested for falling edge events.
+    timeout : float, optional
+        Maximum time to wait for an edge (s), by default 1.
+
+    Attributes
+    ----------
+    n_missed : int
+        Number of conversions that were not read.
+    """
+
+    # reads are clocked by the DRDY line
+    clocked = True
+
+    def __init__(self, spi_1, spi_2, cs_line, drdy_line, timeout=1.0):
+        super().__init__(spi_1, spi_2, cs_line)
+        self.drdy_line = drdy_line
+        self.timeout = timeout
+        self.n_missed = 0
+
+    def read(self):
+        """
+        Wait for the next conversion and return the concatenated frames of
+        both chips (54 bytes) and the time of the DRDY edge (s, monotonic
+        clock).
+        """
+
+        # wait for DRDY edge
+        if not self.drdy_line.event_wait(sec=int(self.timeout),
+                                         nsec=int(self.timeout % 1 * 1e9)):
+            raise RuntimeError(f"No DRDY edge within {self.timeout} s; check "
+                               "that the ADS1299 is started and in RDATAC mode")
+        event = self.drdy_line.event_read()
+
+        # skip to the latest edge if several are pending
+        while self.drdy_line.event_wait(sec=0, nsec=0):
+            event = self.drdy_line.event_read()
+            self.n_missed += 1
+        timestamp = event.sec + event.nsec * 1e-9
+
+        return super().read(), timestamp
+
+
+class AcquisitionEngine:
+    """
+    Threaded acquisition: a paced reader thread and a batched writer thread.
+
+    Parameters
+    ----------
+    reader : object
+        Frame source with a frame_bytes attribute and a read() method returning
+        one raw sample (both chips), e.g. SpiFrameReader. If reader.clocked is
+        True (e.g. DrdyFrameReader), read() blocks until a sample is available
+        and returns it with its monotonic timestamp, and fs is only used to
+        set the number of samples recorded by run().
+    sink : callable
+        Called by the writer thread as sink(times, voltages) with arrays of
+        shape (n_frames,) and (n_frames, 16).
+    fs : float
+        Sampling frequency (Hz).
+    gain : int, optional
+        Programmable gain of the chips, used to scale the decoded voltages,
+        by default 1.
+    buffer_size : int, optional
+        Capacity of the ring buffer (frames), by default 2**14.
+    batch_size : int, optional
+        Maximum number of frames decoded and written at once, by default 256.
+
+    Attributes
+    ----------
+    n_read : int
+        Number of frames read.
+    n_written : int
+        Number of frames passed to the sink.
+    n_late : int
+        Number of frames read more than one sample period after their
+        scheduled time (paced readers only).
+    n_overruns : int
+        Number of frames dropped because the ring buffer was full.
+    """
+
+    def __init__(self, reader, sink, fs, gain=1, buffer_size=2**14,
+                 batch_size=256):
+        self.reader = reader
+        self.sink = sink
+        self.fs = fs
+        self.gain = gain
+        self.batch_size = batch_size
+        self.buffer = RingBuffer(buffer_size, reader.frame_bytes)
+
+        self.n_read = 0
+        self.n_written = 0
+        self.n_late = 0
+        self.errors = []
+        self._stop = threading.Event()
+        self._reading = threading.Event()
+        self._threads = []
+
+    @property
+    def n_overruns(self):
+        return self.buffer.n_overruns
+
+    def start(self, n_samples=None):
+        """
+        Start the reader and writer threads. The reader stops after n_samples
+        frames (or when stop() is called).
+        """
+
+        self._stop.clear()
+        self._reading.set()
+        self._threads = [
+            threading.Thread(target=self._read_loop, args=(n_samples,),
+                             daemon=True),
+            threading.Thread(target=self._write_loop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop reading, write all buffered frames and wait for the threads."""
+
+        self._stop.set()
+        self.join()
+
+    def join(self, timeout=None):
+        """Wait for the threads to finish."""
+
+        for thread in self._threads:
+            thread.join(timeout)
+        if self.errors:
+            raise self.errors[0]
+
+    def run(self, duration):
+        """Record for duration seconds and return when all frames are written."""
+
+        self.start(int(duration * self.fs))
+        try:
+            self.join()
+        except KeyboardInterrupt:
+            self.stop()
+
+    def get_stats(self):
+        """Return the acquisition counters."""
+
+        stats = {'n_read': self.n_read, 'n_written': self.n_written,
+                 'n_late': self.n_late, 'n_overruns': self.n_overruns,
+                 'n_buffered': len(self.buffer)}
+        if hasattr(self.reader, 'n_missed'):
+            stats['n_missed'] = self.reader.n_missed
+
+        return stats
+
+    def _read_loop(self, n_samples):
+        """Read frames at the sampling rate, timestamped with a monotonic clock."""
+
+        try:
+            t_start = monotonic()
+            i_sample = 0
+            while not self._stop.is_set() and \
+                    (n_samples is None or i_sample < n_samples):
+                # read frame when the reader signals a new sample
+                if self.reader.clocked:
+                    frame, timestamp = self.reader.read()
+                    self.buffer.push(frame, timestamp - t_start)
+                    self.n_read += 1
+                    i_sample += 1
+                    continue
+
+                # wait for sample time
+                t_sample = i_sample / self.fs
+                delay = t_sample - (monotonic() - t_start)
+                if delay > 0:
+                    sleep(delay)
+                elif -delay > 1 / self.fs:
+                    self.n_late += 1
+
+                # read frame
+                timepoint = monotonic() - t_start
+                self.buffer.push(self.reader.read(), timepoint)
+                self.n_read += 1
+                i_sample += 1
+        except Exception as error:
+            self.errors.append(error)
+        finally:
+            self._reading.clear()
+
+    def _write_loop(self):
+        """Decode and write batches of frames until reading has finished."""
+
+        try:
+            while True:
+                reading = self._reading.is_set()
+                frames, times = self.buffer.pop(self.batch_size)
+                if len(frames):
+                    self.sink(times, decode_frames(frames, gain=self.gain))
+                    self.n_written += len(frames)
+                elif not reading:
+                    break
+                else:
+                    sleep(min(0.01, self.batch_size / self.fs / 4))
+        except Exception as error:
+            self.errors.append(error)
+            self._stop.set()
+
+
+class CsvSink:
+    """
+    Append batches of samples to a CSV file in the pieeg_to_csv.py format.
+
+    Parameters
+    ----------
+    fname : str
+        Output filename. The header is written when the sink is created.
+    columns : list of str
+        Channel names.
+    """
+
+    def __init__(self, fname, columns):
+        self._file = open(fname, 'w')
+        self._file.write("time," + ",".join(columns) + "\n")
+        self._fmt = ['%.6f'] + ['%.2f'] * len(columns)
+
+    def write(self, times, data):
+        np.savetxt(self._file, np.column_stack([times, data]), fmt=self._fmt,
+                   delimiter=', ')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SimulatedSpi:
+    """
+    Simulated ADS1299 SPI device returning frames of random 24-bit samples,
+    with registers that can be written and read back.
+
+    Parameters
+    ----------
+    seed : int, optional
+        Random seed.
+    read_time : float, optional
+        Time taken by each read (s), to mimic the SPI transfer.
+    """
+
+    def __init__(self, seed=None, read_time=0):
+        self.rng = np.random.default_rng(seed)
+        self.read_time = read_time
+        self.n_reads = 0
+        self.registers = [0] * 0x18
+
+    def readbytes(self, n_bytes):
+        if self.read_time:
+            sleep(self.read_time)
+        self.n_reads += 1
+        status = [0xC0, 0x00, 0x00]
+
+        return status + self.rng.integers(0, 256, n_bytes - 3).tolist()
+
+    def xfer(self, data):
+        """Emulate the register commands (WREG, RREG); other bytes read as 0."""
+
+        output = [0] * len(data)
+        if len(data) > 2 and data[0] & 0xE0 in [0x20, 0x40]:
+            start, n_registers = data[0] & 0x1F, data[1] + 1
+            if data[0] & 0xE0 == 0x40:
+                self.registers[start:start + n_registers] = data[2:2 + n_registers]
+            else:
+                output[2:2 + n_registers] = self.registers[start:start + n_registers]
+
+        return output
+
+
+class SimulatedLine:
+    """Simulated gpiod output line."""
+
+    def __init__(self):
+        self.value = 1
+
+    def set_value(self, value):
+        self.value = value
+
+
+class SimulatedDrdyLine:
+    """
+    Simulated gpiod DRDY line (v1 API), with a falling edge every 1/fs seconds
+    on the monotonic clock, as for an ADS1299 in continuous conversion mode.
+
+    Parameters
+    ----------
+    fs : float
+        Data rate (Hz).
+    """
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.t_start = None
+        self.i_edge = 0
+
+    def request(self, consumer=None, type=None):
+        self.t_start = monotonic()
+
+    def event_wait(self, sec=0, nsec=0):
+        """Wait up to the timeout for an edge; return True if one is pending."""
+
+        if self.t_start is None:
+            self.request()
+        t_edge = self.t_start + self.i_edge / self.fs
+        delay = t_edge - monotonic()
+        if delay > sec + nsec * 1e-9:
+            sleep(sec + nsec * 1e-9)
+            return False
+        if delay > 0:
+            sleep(delay)
+
+        return True
+
+    def event_read(self):
+        """Return the oldest pending edge, blocking until it occurs."""
+
+        self.event_wait(sec=int(1e9))
+        t_edge = self.t_start + self.i_edge / self.fs
+        self.i_edge += 1
+
+        return SimpleNamespace(sec=int(t_edge), nsec=int(t_edge % 1 * 1e9))
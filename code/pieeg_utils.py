@@ -1,10 +1,38 @@
 
 # imports
-import spidev
-from RPi import GPIO
-GPIO.setwarnings(False) 
-GPIO.setmode(GPIO.BOARD)
-import gpiod
+import numpy as np
+
+# hardware libraries are only available on the Raspberry Pi; decoding functions
+# can be used without them
+try:
+    import spidev
+    from RPi import GPIO
+    GPIO.setwarnings(False) 
+    GPIO.setmode(GPIO.BOARD)
+    import gpiod
+except ImportError:
+    spidev = GPIO = gpiod = None
+
+# ADS1299 data frame: 3 status bytes followed by 8 channels of 3 bytes
+FRAME_BYTES = 27
+STATUS_BYTES = 3
+
+# ADS1299 commands
+WAKEUP = 0x02
+STOP = 0x0A
+RESET = 0x06
+SDATAC = 0x11
+RDATAC = 0x10
+START = 0x08
+RREG = 0x20
+WREG = 0x40
+
+# bits compared when reading back registers: CONFIG3 bit 0 (BIAS_STAT) is
+# read-only and the GPIO data bits (7:4) reflect the pin levels
+READ_MASKS = {0x03: 0xFE, 0x14: 0x0F}
+
+# GPIO line of the DRDY (data ready) output of the ADS1299
+DRDY_PIN = 26
 
 
 def get_voltage(output, a, data_check=0xFFFFFF, data_test=0x7FFFFF):
@@ -16,11 +44,72 @@ def get_voltage(output, a, data_check=0xFFFFFF, data_test=0x7FFFFF):
     voltage = round(1000000*4.5*(voltage/16777215),2)
 
     return voltage
+
+
+def decode_frames(frames, n_chips=2, gain=1):
+    """
+    Decode raw ADS1299 data frames into voltages.
+
+    Vectorized equivalent of calling get_voltage() for each channel of each 
+    frame: the 24-bit big-endian samples of all frames are assembled at once 
+    and sign-extended (with the same offset as get_voltage()). Voltages are
+    divided by the programmable gain, so they are referred to the electrode
+    input for any gain.
+
+    Parameters
+    ----------
+    frames : bytes or array-like of uint8
+        Raw frames of FRAME_BYTES (27) bytes per chip, with the frames of all 
+        chips for a sample stored consecutively, e.g. a buffer of shape 
+        (n_samples, 54) holding the reads of both chips of the PiEEG-16.
+    n_chips : int, optional
+        Number of chips per sample, by default 2.
+    gain : int, optional
+        Programmable gain the chips were configured with, by default 1.
+
+    Returns
+    -------
+    voltage : np.array
+        Voltages of shape (n_samples, n_chips * 8), rounded to 2 decimals.
+    """
+
+    # split into samples and chips and drop status bytes
+    frames = np.frombuffer(frames, dtype=np.uint8) \
+        if isinstance(frames, (bytes, bytearray)) else np.asarray(frames, dtype=np.uint8)
+    frames = frames.reshape(-1, n_chips, FRAME_BYTES)
+    samples = frames[:, :, STATUS_BYTES:].reshape(len(frames), -1, 3).astype(np.int32)
+
+    # assemble 24-bit values
+    voltage = (samples[..., 0] << 16) | (samples[..., 1] << 8) | samples[..., 2]
+
+    # sign extension
+    voltage = np.where(voltage & 0x800000, voltage - 16777214, voltage)
+    voltage = np.round(1000000 * 4.5 * (voltage / 16777215) / gain, 2)
+
+    return voltage
     
     
-def setup_pieeg16(gain=1):
-    # Convert gain to bits
-    gain = convert_gain(gain)
+def setup_pieeg16(gain=1, data_rate=250, verify=True):
+    """
+    Set up the SPI devices and chip select line of the PiEEG-16 and configure
+    both ADS1299 chips with the register map returned by get_register_map().
+
+    Parameters
+    ----------
+    gain : int, optional
+        Programmable gain of all channels, by default 1.
+    data_rate : int, optional
+        Data rate (Hz), by default 250.
+    verify : bool, optional
+        Whether to read the registers back after writing them, by default True.
+
+    Returns
+    -------
+    spi_1, spi_2 : spidev.SpiDev
+        SPI devices of the first and last 8 channels.
+    cs_line : gpiod.Line
+        Chip select line of the second chip.
+    """
 
     # GPIO settings
     chip = gpiod.Chip("gpiochip4")
@@ -44,95 +133,171 @@ def setup_pieeg16(gain=1):
     spi_2.mode=0b01
     spi_2.bits_per_word = 8
 
-    # Register Commands
-    who_i_am=0x00
-    config1=0x01
-    config2=0X02
-    config3=0X03
-
-    reset=0x06
-    stop=0x0A
-    start=0x08
-    sdatac=0x11
-    rdatac=0x10
-    wakeup=0x02
-    rdata = 0x12
-
-    ch1set=0x05
-    ch2set=0x06
-    ch3set=0x07
-    ch4set=0x08
-    ch5set=0x09
-    ch6set=0x0A
-    ch7set=0x0B
-    ch8set=0x0C
-
-    # device initialization and configuration - first 8 channels
-    send_command (spi_1, wakeup)
-    send_command (spi_1, stop)
-    send_command (spi_1, reset)
-    send_command (spi_1, sdatac)
-
-    write_byte (spi_1, 0x14, 0x80) #GPIO 80
-    write_byte (spi_1, config1, 0x96)
-    write_byte (spi_1, config2, 0xD4)
-    write_byte (spi_1, config3, 0xFF)
-    write_byte (spi_1, 0x04, 0x00)
-    write_byte (spi_1, 0x0D, 0x00)
-    write_byte (spi_1, 0x0E, 0x00)
-    write_byte (spi_1, 0x0F, 0x00)
-    write_byte (spi_1, 0x10, 0x00)
-    write_byte (spi_1, 0x11, 0x00)
-    write_byte (spi_1, 0x15, 0x20)
-
-    write_byte (spi_1, 0x17, 0x00)
-    write_byte (spi_1, ch1set, gain)
-    write_byte (spi_1, ch2set, gain)
-    write_byte (spi_1, ch3set, gain)
-    write_byte (spi_1, ch4set, gain)
-    write_byte (spi_1, ch5set, gain)
-    write_byte (spi_1, ch6set, gain)
-    write_byte (spi_1, ch7set, gain)
-    write_byte (spi_1, ch8set, gain)
-
-    send_command (spi_1, rdatac)
-    send_command (spi_1, start)
-
-    # device initialization and configuration - last 8 channels
-    send_command_2 (spi_2, cs_line, wakeup)
-    send_command_2 (spi_2, cs_line, stop)
-    send_command_2 (spi_2, cs_line, reset)
-    send_command_2 (spi_2, cs_line, sdatac)
-
-    write_byte_2 (spi_2, cs_line, 0x14, 0x80) #GPIO 80
-    write_byte_2 (spi_2, cs_line, config1, 0x96)
-    write_byte_2 (spi_2, cs_line, config2, 0xD4)
-    write_byte_2 (spi_2, cs_line, config3, 0xFF)
-    write_byte_2 (spi_2, cs_line, 0x04, 0x00)
-    write_byte_2 (spi_2, cs_line, 0x0D, 0x00)
-    write_byte_2 (spi_2, cs_line, 0x0E, 0x00)
-    write_byte_2 (spi_2, cs_line, 0x0F, 0x00)
-    write_byte_2 (spi_2, cs_line, 0x10, 0x00)
-    write_byte_2 (spi_2, cs_line, 0x11, 0x00)
-    write_byte_2 (spi_2, cs_line, 0x15, 0x20)
-
-    write_byte_2 (spi_2, cs_line, 0x17, 0x00)
-    write_byte_2 (spi_2, cs_line, ch1set, gain)
-    write_byte_2 (spi_2, cs_line, ch2set, gain)
-    write_byte_2 (spi_2, cs_line, ch3set, gain)
-    write_byte_2 (spi_2, cs_line, ch4set, gain)
-    write_byte_2 (spi_2, cs_line, ch5set, gain)
-    write_byte_2 (spi_2, cs_line, ch6set, gain)
-    write_byte_2 (spi_2, cs_line, ch7set, gain)
-    write_byte_2 (spi_2, cs_line, ch8set, gain)
-
-    send_command_2 (spi_2, cs_line, rdatac)
-    send_command_2 (spi_2, cs_line, start)
+    # device initialization and configuration - first 8 and last 8 channels
+    register_map = get_register_map(gain, data_rate)
+    configure_ads1299(spi_1, register_map, verify=verify)
+    configure_ads1299(spi_2, register_map, cs_line=cs_line, verify=verify)
 
     return spi_1, spi_2, cs_line
 
 
+def get_register_map(gain=1, data_rate=250):
+    """
+    Get the ADS1299 register configuration of the PiEEG-16 (same for both
+    chips).
+
+    Parameters
+    ----------
+    gain : int, optional
+        Programmable gain of all channels (1, 2, 4, 6, 8, 12 or 24), by
+        default 1.
+    data_rate : int, optional
+        Data rate (Hz), by default 250.
+
+    Returns
+    -------
+    register_map : dict
+        Register values, keyed by register address.
+    """
+
+    # channel settings: normal electrode input, gain in bits 6:4
+    chnset = convert_gain(gain) << 4
+
+    register_map = {
+        0x01: 0x90 | convert_data_rate(data_rate),  # CONFIG1
+        0x02: 0xD4,  # CONFIG2
+        0x03: 0xFF,  # CONFIG3
+        0x04: 0x00,  # LOFF
+        **{register: chnset for register in range(0x05, 0x0D)},  # CH1SET-CH8SET
+        0x0D: 0x00,  # BIAS_SENSP
+        0x0E: 0x00,  # BIAS_SENSN
+        0x0F: 0x00,  # LOFF_SENSP
+        0x10: 0x00,  # LOFF_SENSN
+        0x11: 0x00,  # LOFF_FLIP
+        0x14: 0x80,  # GPIO
+        0x15: 0x20,  # MISC1
+        0x16: 0x00,  # MISC2
+        0x17: 0x00,  # CONFIG4
+    }
+
+    return register_map
+
+
+def configure_ads1299(spi, register_map, cs_line=None, verify=True):
+    """
+    Reset an ADS1299, write its registers and start continuous conversion.
+
+    Consecutive registers are written with a single multi-register WREG command
+    (one transfer and one chip select assertion per block), and read back with
+    RREG before conversions are started.
+
+    Parameters
+    ----------
+    spi : spidev.SpiDev
+        SPI device of the chip.
+    register_map : dict
+        Register values, keyed by register address (see get_register_map()).
+    cs_line : gpiod.Line, optional
+        Chip select line, if not driven by the SPI device.
+    verify : bool, optional
+        Whether to read the registers back after writing them, by default True.
+
+    Raises
+    ------
+    RuntimeError
+        If a register read back does not match the value written.
+    """
+
+    for command in [WAKEUP, STOP, RESET, SDATAC]:
+        transfer(spi, [command], cs_line)
+
+    blocks = get_register_blocks(register_map)
+    for start, values in blocks:
+        write_registers(spi, start, values, cs_line)
+
+    if verify:
+        mismatches = []
+        for start, values in blocks:
+            values_read = read_registers(spi, start, len(values), cs_line)
+            for register, value, value_read in zip(range(start, start + len(values)),
+                                                   values, values_read):
+                mask = READ_MASKS.get(register, 0xFF)
+                if value & mask != value_read & mask:
+                    mismatches.append(f"0x{register:02X}: wrote 0x{value:02X}, "
+                                      f"read 0x{value_read:02X}")
+        if mismatches:
+            raise RuntimeError("ADS1299 register verification failed ("
+                               + "; ".join(mismatches) + ")")
+
+    transfer(spi, [RDATAC], cs_line)
+    transfer(spi, [START], cs_line)
+
+
+def get_register_blocks(register_map):
+    """Group a register map into blocks of consecutive registers."""
+
+    blocks = []
+    for register in sorted(register_map):
+        if blocks and register == blocks[-1][0] + len(blocks[-1][1]):
+            blocks[-1][1].append(register_map[register])
+        else:
+            blocks.append((register, [register_map[register]]))
+
+    return blocks
+
+
+def setup_drdy_line(pin=DRDY_PIN, chip_name="gpiochip4"):
+    """
+    Request the DRDY line of the ADS1299 for falling edge events (gpiod v1 API).
+
+    DRDY goes low when a new conversion is available, at the data rate set in
+    setup_pieeg16().
+
+    Parameters
+    ----------
+    pin : int, optional
+        GPIO line of DRDY, by default DRDY_PIN (GPIO26).
+    chip_name : str, optional
+        GPIO chip, by default "gpiochip4" (as for the chip select line).
+
+    Returns
+    -------
+    drdy_line : gpiod.Line
+        Line to wait on with event_wait() and event_read().
+    """
+
+    chip = gpiod.Chip(chip_name)
+    drdy_line = chip.get_line(pin)
+    drdy_line.request(consumer="DRDY", type=gpiod.LINE_REQ_EV_FALLING_EDGE)
+
+    return drdy_line
+
+
 # SPI Read/Write Functions
+def transfer(spi, data, cs_line=None):
+    # transfer bytes in a single transaction, asserting CS if needed
+    if cs_line is not None:
+        cs_line.set_value(0)
+    output = spi.xfer(list(data))
+    if cs_line is not None:
+        cs_line.set_value(1)
+
+    return output
+
+
+def write_registers(spi, start, values, cs_line=None):
+    # WREG: opcode, number of registers - 1, values
+    transfer(spi, [WREG | start, len(values) - 1] + list(values), cs_line)
+
+
+def read_registers(spi, start, n_registers, cs_line=None):
+    # RREG: opcode, number of registers - 1, then clock out the values
+    output = transfer(spi, [RREG | start, n_registers - 1] + [0x00] * n_registers,
+                      cs_line)
+
+    return list(output[2:])
+
+
 def read_byte(spi, register):
     write=0x20
     register_write=write|register
@@ -195,3 +360,14 @@ def convert_gain(value):
         return 0b110
     else:
         raise ValueError("Invalid gain value. Please use 1, 2, 4, 6, 8, 12, or 24.")
+
+
+def convert_data_rate(value):
+    # convert data rate (samples per second) to CONFIG1 bits
+    data_rates = {16000: 0b000, 8000: 0b001, 4000: 0b010, 2000: 0b011,
+                  1000: 0b100, 500: 0b101, 250: 0b110}
+    if value not in data_rates:
+        raise ValueError("Invalid data rate. Please use 250, 500, 1000, 2000, "
+                         "4000, 8000, or 16000.")
+
+    return data_rates[value]
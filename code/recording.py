@@ -0,0 +1,206 @@
+"""
+Lazy access to processed recordings.
+
+A Recording opens a processed recording without loading it. Data are read only
+when requested, and only for the requested channels and time range:
+
+- Parquet (processed silicon probe recordings; one column per channel plus
+  'time'): only the requested columns are read, and row groups outside the time
+  range are skipped using their statistics (requires pyarrow).
+- CSV (PiEEG recordings; 'time' column plus one column per channel): only the
+  requested columns are parsed, and reading stops once the end of the time
+  range is reached.
+- NPZ (manuscript data; 'signals' of shape (n_channels, n_samples) and 'time'):
+  arrays stored uncompressed (np.savez) are memory-mapped, so only the bytes of
+  the requested slice are read.
+
+Example:
+    recording = Recording("data/manuscript/signals_fungal.npz")
+    signals, time = recording.get_data(channels=[0, 1], t_start=900, t_stop=1200)
+
+"""
+
+# imports
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+
+
+class Recording:
+    """
+    Lazily loaded recording.
+
+    Parameters
+    ----------
+    fname : str
+        Filename of a processed recording (.parquet, .csv or .npz).
+    csv_chunk_size : int, optional
+        Number of rows parsed at a time when reading CSV files.
+
+    Attributes
+    ----------
+    channels : list
+        Channel names (column names for Parquet/CSV, indices for NPZ).
+    """
+
+    def __init__(self, fname, csv_chunk_size=2**16):
+        self.fname = fname
+        self.csv_chunk_size = csv_chunk_size
+        self.format = os.path.splitext(fname)[1].lower().lstrip('.')
+
+        if self.format == 'parquet':
+            import pyarrow.parquet as pq
+
+            self._parquet = pq.ParquetFile(fname)
+            self.channels = [name for name in self._parquet.schema_arrow.names
+                             if name != 'time']
+
+        elif self.format == 'csv':
+            columns = pd.read_csv(fname, nrows=0, skipinitialspace=True).columns
+            self.channels = [name for name in columns if name != 'time']
+
+        elif self.format == 'npz':
+            self._signals = _load_npz_member(fname, 'signals')
+            self._time = _load_npz_member(fname, 'time')
+            self.channels = list(range(self._signals.shape[0]))
+
+        else:
+            raise ValueError("Recording must be a .parquet, .csv or .npz file")
+
+    def __repr__(self):
+        return (f"Recording('{self.fname}', format={self.format}, "
+                f"n_channels={len(self.channels)})")
+
+    def get_data(self, channels=None, t_start=None, t_stop=None):
+        """
+        Read signals for a set of channels and a time range.
+
+        Parameters
+        ----------
+        channels : list, optional
+            Channel names or indices into self.channels. Defaults to all
+            channels.
+        t_start, t_stop : float, optional
+            Time range to read (inclusive), in the units of the recording's time
+            column. Defaults to the whole recording.
+
+        Returns
+        -------
+        signals : np.array
+            Signals of shape (n_channels, n_samples).
+        time : np.array
+            Time of each sample.
+        """
+
+        channels = self._get_channel_names(channels)
+
+        if self.format == 'parquet':
+            return self._read_parquet(channels, t_start, t_stop)
+        elif self.format == 'csv':
+            return self._read_csv(channels, t_start, t_stop)
+        else:
+            return self._read_npz(channels, t_start, t_stop)
+
+    def _get_channel_names(self, channels):
+        """Convert channel names or indices into channel names."""
+
+        if channels is None:
+            return list(self.channels)
+
+        names = []
+        for channel in channels:
+            if channel in self.channels:
+                names.append(channel)
+            elif isinstance(channel, (int, np.integer)):
+                names.append(self.channels[channel])
+            else:
+                raise ValueError(f"Channel {channel} not found in {self.fname}")
+
+        return names
+
+    def _read_parquet(self, channels, t_start, t_stop):
+        """Read columns, skipping row groups outside of the time range."""
+        import pyarrow.parquet as pq
+
+        filters = []
+        if t_start is not None:
+            filters.append(('time', '>=', t_start))
+        if t_stop is not None:
+            filters.append(('time', '<=', t_stop))
+        table = pq.read_table(self.fname, columns=channels + ['time'],
+                              filters=filters or None)
+        signals = np.stack([table.column(name).to_numpy() for name in channels])
+
+        return signals, table.column('time').to_numpy()
+
+    def _read_csv(self, channels, t_start, t_stop):
+        """Parse requested columns, stopping after the end of the time range."""
+
+        chunks = []
+        reader = pd.read_csv(self.fname, usecols=['time'] + channels,
+                             skipinitialspace=True,
+                             chunksize=self.csv_chunk_size)
+        for chunk in reader:
+            time = chunk['time']
+            mask = np.ones(len(chunk), dtype=bool)
+            if t_start is not None:
+                mask &= (time >= t_start).to_numpy()
+            if t_stop is not None:
+                mask &= (time <= t_stop).to_numpy()
+            chunks.append(chunk[mask])
+
+            # time is increasing, so later rows are outside of the range
+            if t_stop is not None and time.iloc[-1] > t_stop:
+                break
+        reader.close()
+
+        data = pd.concat(chunks)
+
+        return data[channels].to_numpy().T, data['time'].to_numpy()
+
+    def _read_npz(self, channels, t_start, t_stop):
+        """Slice memory-mapped arrays; time is searched, not scanned."""
+
+        i_start, i_stop = 0, len(self._time)
+        if t_start is not None:
+            i_start = np.searchsorted(self._time, t_start, side='left')
+        if t_stop is not None:
+            i_stop = np.searchsorted(self._time, t_stop, side='right')
+        signals = np.stack([self._signals[channel, i_start:i_stop]
+                            for channel in channels])
+
+        return signals, np.array(self._time[i_start:i_stop])
+
+
+def _load_npz_member(fname, key):
+    """
+    Memory-map an array stored uncompressed in an .npz file, without reading
+    it. Compressed arrays (np.savez_compressed) cannot be memory-mapped and
+    are loaded in full.
+    """
+
+    with zipfile.ZipFile(fname) as archive:
+        info = archive.getinfo(f"{key}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        with np.load(fname) as data_in:
+            return data_in[key]
+
+    with open(fname, 'rb') as f:
+        # skip the zip local file header to the start of the .npy file
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_length = int.from_bytes(local_header[26:28], 'little')
+        extra_length = int.from_bytes(local_header[28:30], 'little')
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+
+        # read the .npy header
+        if np.lib.format.read_magic(f) == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        else:
+            header = np.lib.format.read_array_header_2_0(f)
+        shape, fortran_order, dtype = header
+        offset = f.tell()
+
+    return np.memmap(fname, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
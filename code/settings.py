@@ -14,3 +14,6 @@ SPECPARAM_SETTINGS = {
     'peak_threshold'    :   3 # default : 2.0
 }
 N_JOBS = -1 # for parallelization
+
+CACHE_DIR = "data/cache" # on-disk cache of fit results (see cache.FitCache)
+CACHE_MAX_BYTES = 2**30 # maximum size of the fit cache; least recently used entries are evicted
@@ -6,13 +6,53 @@ from scipy import signal
 import matplotlib.pyplot as plt
 import os
 import pandas as pd
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
+import sys
+sys.path.append("code")
+from utils import get_n_jobs
 
-def downsample(trace, original_fs, target_fs, apply_filter=True):
-    """Downsample a trace from original_fs to target_fs using decimation.
-    Optionally apply an anti-aliasing filter before downsampling.
+# Open Ephys .continuous file format
+CONTINUOUS_HEADER_BYTES = 1024
+CONTINUOUS_BLOCK_LENGTH = 1024
+CONTINUOUS_RECORD_MARKER = np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 255], 
+                                    dtype=np.uint8)
+CONTINUOUS_RECORD_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('n_samples', '<u2'),
+    ('recording_number', '<u2'),
+    ('samples', '>i2', (CONTINUOUS_BLOCK_LENGTH,)),
+    ('marker', 'u1', (10,))
+])
+
+
+def downsample(trace, original_fs, target_fs, apply_filter=True, 
+               method='polyphase'):
+    """Downsample a trace from original_fs to target_fs.
+
+    By default, polyphase resampling (scipy.signal.resample_poly) is used: the 
+    anti-aliasing FIR filter is applied as part of the resampling, in a single 
+    pass that only computes the retained output samples, and non-integer 
+    ratios between original_fs and target_fs are handled exactly.
+    
+    With method='decimate', the original implementation is used: an optional 
+    Butterworth anti-aliasing filter (apply_filter) followed by FIR decimation 
+    by int(original_fs / target_fs). The polyphase anti-aliasing filter is 
+    always applied, so apply_filter=False requires method='decimate'.
     """
 
+    if method == 'polyphase':
+        if not apply_filter:
+            raise ValueError("apply_filter=False requires method='decimate'; "
+                             "polyphase resampling always applies its "
+                             "anti-aliasing filter")
+        up, down = get_resample_ratio(original_fs, target_fs)
+        return signal.resample_poly(trace, up, down)
+
+    elif method != 'decimate':
+        raise ValueError("method must be 'polyphase' or 'decimate'")
+
     # Check if the target_fs is less than the original_fs
     if apply_filter:
         # Apply Nyquist criterion
@@ -33,46 +73,274 @@ def downsample(trace, original_fs, target_fs, apply_filter=True):
     return downsampled
 
 
-def process_channel(filename, fs=20000, target_fs=250, apply_filter=True):
-    """Process a single channel file"""
+def get_resample_ratio(original_fs, target_fs, max_denominator=10000):
+    """Express target_fs / original_fs as a ratio of integers (up, down)."""
+
+    ratio = Fraction(target_fs / original_fs).limit_denominator(max_denominator)
+
+    return ratio.numerator, ratio.denominator
+
+
+class StreamingResampler:
+    """Polyphase resampler for traces processed in consecutive blocks.
+
+    Blocks are resampled with scipy.signal.resample_poly together with enough
+    neighbouring samples (carried over between blocks) to cover the support of 
+    the FIR filter, and the outputs that depend on the added context are 
+    discarded (overlap-save). Memory use is bounded by the block size and the 
+    output matches downsample(trace, original_fs, target_fs) up to floating 
+    point error.
+
+    Parameters
+    ----------
+    original_fs : float
+        Original sampling frequency (Hz).
+    target_fs : float
+        Target sampling frequency (Hz).
+
+    Examples
+    --------
+    >>> resampler = StreamingResampler(20000, 250)
+    >>> output = [resampler.process(block) for block in blocks]
+    >>> output.append(resampler.flush())
+    >>> downsampled = np.concatenate(output)
+    """
+
+    def __init__(self, original_fs, target_fs):
+        self.up, self.down = get_resample_ratio(original_fs, target_fs)
+
+        # context needed on each side to cover the filter used by 
+        # resample_poly (half length 10 * max(up, down) at the upsampled rate),
+        # rounded up to a multiple of down so outputs stay on the same grid
+        half_len = 10 * max(self.up, self.down)
+        n_context = (half_len + self.down) // self.up + 2
+        self.n_context = self.down * int(np.ceil(n_context / self.down))
+
+        # buffer of samples [buffer_start, buffer_start + len(buffer)), and the 
+        # first input sample whose outputs have not been returned yet
+        self.buffer = np.zeros(0)
+        self.buffer_start = 0
+        self.next_start = 0
+
+    def process(self, block):
+        """Add a block of samples and return all outputs that are complete."""
+
+        self.buffer = np.concatenate([self.buffer, np.asarray(block, dtype=float)])
+
+        # outputs for input samples up to 'stop' only depend on samples already 
+        # in the buffer
+        buffer_stop = self.buffer_start + len(self.buffer)
+        stop = (buffer_stop - self.n_context) // self.down * self.down
+        if stop <= self.next_start:
+            return np.zeros(0)
+
+        return self._resample(stop, stop + self.n_context)
+
+    def flush(self):
+        """Return the remaining outputs at the end of the trace."""
+
+        buffer_stop = self.buffer_start + len(self.buffer)
+        if buffer_stop <= self.next_start:
+            return np.zeros(0)
+
+        return self._resample(buffer_stop, buffer_stop)
+
+    def _resample(self, stop, context_stop):
+        """
+        Resample input samples [next_start, stop) using the buffered samples in
+        [next_start - n_context, context_stop) as context.
+        """
+
+        # resample segment with context on either side
+        context_start = max(self.next_start - self.n_context, 0)
+        segment = self.buffer[context_start - self.buffer_start:
+                              context_stop - self.buffer_start]
+        resampled = signal.resample_poly(segment, self.up, self.down)
+
+        # keep outputs belonging to [next_start, stop)
+        i_start = (self.next_start - context_start) * self.up // self.down
+        i_stop = i_start + _n_outputs(stop, self.up, self.down) - \
+            _n_outputs(self.next_start, self.up, self.down)
+        output = resampled[i_start:i_stop]
+
+        # drop samples that are no longer needed as context
+        self.next_start = stop
+        n_drop = max(stop - self.n_context, 0) - self.buffer_start
+        if n_drop > 0:
+            self.buffer = self.buffer[n_drop:]
+            self.buffer_start += n_drop
+
+        return output
+
+
+def _n_outputs(n_samples, up, down):
+    """Number of resample_poly outputs for n_samples inputs."""
+
+    return -(-n_samples * up // down)
+
+
+def process_channel(filename, fs=20000, target_fs=250, apply_filter=True,
+                    chunk_size=2**22, scale=True):
+    """Process a single channel file.
+
+    Samples are read from the Open Ephys .continuous records (see 
+    load_continuous) and, if scale is True, converted to microvolts using the 
+    header's bitVolts. By default the trace is downsampled in blocks of about 
+    chunk_size samples with a StreamingResampler, so memory use does not grow 
+    with the recording length. If chunk_size is None, the whole trace is loaded
+    and passed to downsample(). With apply_filter=False, the whole trace is 
+    downsampled with method='decimate' (no anti-aliasing filter), as the 
+    polyphase resampler always filters.
+    """
     # Memory map the file
-    data = np.memmap(filename, dtype=np.int16, mode='r', offset=0)
+    header, records = load_continuous(filename)
+    samples = records['samples']
+    gain = header.get('bitVolts', 1.0) if scale else 1.0
+
+    # Report gaps in the recording
+    gaps = find_continuous_gaps(records)
+    if len(gaps):
+        print(f"    Warning: {len(gaps)} gaps found in {os.path.basename(filename)}")
     
-    # Downsample using the provided function
-    downsampled_data = downsample(data, fs, target_fs, apply_filter)
+    # Downsample the whole trace using the provided function
+    if not apply_filter:
+        return downsample(samples.reshape(-1) * gain, fs, target_fs, 
+                          apply_filter=False, method='decimate')
+    if chunk_size is None:
+        return downsample(samples.reshape(-1) * gain, fs, target_fs)
+
+    # Downsample in blocks of records, converting one block at a time to float
+    n_records = max(1, chunk_size // samples.shape[1])
+    resampler = StreamingResampler(fs, target_fs)
+    downsampled_data = [
+        resampler.process(samples[i_start:i_start + n_records].reshape(-1) * gain)
+        for i_start in range(0, len(samples), n_records)]
+    downsampled_data.append(resampler.flush())
     
-    return downsampled_data
+    return np.concatenate(downsampled_data)
+
+
+def read_continuous_header(filename):
+    """Parse the text header of an Open Ephys .continuous file.
+
+    The header is 1024 bytes of lines such as "header.bitVolts = 0.195;". 
+    Values are converted to numbers where possible.
+    """
+    with open(filename, 'rb') as f:
+        text = f.read(CONTINUOUS_HEADER_BYTES).decode('latin-1')
+
+    header = {}
+    for line in text.split(';'):
+        if '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        key = key.strip().replace('header.', '')
+        value = value.strip().strip("'")
+        try:
+            value = float(value) if '.' in value else int(value)
+        except ValueError:
+            pass
+        header[key] = value
+
+    return header
+
+
+def load_continuous(filename):
+    """Memory map an Open Ephys .continuous file without copying.
+
+    After the 1024-byte header, the file consists of records of 1024 samples, 
+    each framed by a timestamp, a sample count, a recording number and a 
+    record marker. The records are exposed through a NumPy structured dtype 
+    (CONTINUOUS_RECORD_DTYPE) over the memmap, so fields are views into the 
+    file:
+
+    - records['timestamp']: int64, timestamp of the first sample of each record
+    - records['n_samples']: uint16, samples per record
+    - records['recording_number']: uint16
+    - records['samples']: big-endian int16 of shape (n_records, 1024)
+    - records['marker']: uint8 of shape (n_records, 10)
+
+    A trailing partial record (e.g. from an interrupted recording) is ignored.
+
+    Returns
+    -------
+    header : dict
+        Parsed file header (see read_continuous_header).
+    records : np.memmap
+        Structured array of records.
+    """
+    header = read_continuous_header(filename)
+
+    # map all complete records
+    n_bytes = os.path.getsize(filename) - CONTINUOUS_HEADER_BYTES
+    n_records = n_bytes // CONTINUOUS_RECORD_DTYPE.itemsize
+    if n_records < 1:
+        raise ValueError(f"{filename} does not contain any complete records")
+    records = np.memmap(filename, dtype=CONTINUOUS_RECORD_DTYPE, mode='r',
+                        offset=CONTINUOUS_HEADER_BYTES, shape=(n_records,))
+
+    # check framing of the first and last records
+    for i_record in [0, -1]:
+        if not np.array_equal(records['marker'][i_record], 
+                              CONTINUOUS_RECORD_MARKER):
+            raise ValueError(f"{filename} has invalid record markers; it may "
+                             "not be an Open Ephys .continuous file")
+
+    return header, records
+
+
+def find_continuous_gaps(records):
+    """Find gaps between consecutive records of a .continuous file.
+
+    Returns the indices of records whose timestamp does not directly follow 
+    the previous record (i.e. differs by other than the number of samples in 
+    the previous record).
+    """
+    timestamps = records['timestamp']
+    expected = timestamps[:-1] + records['n_samples'][:-1]
+
+    return np.flatnonzero(timestamps[1:] != expected) + 1
 
 
 def process_all_channels(folder_path, fs=20000, target_fs=250, 
-                         apply_filter=True):
-    """Process all continuous files in the folder"""
+                         apply_filter=True, n_jobs=1, use_threads=True):
+    """Process all continuous files in the folder.
+
+    Channels can be processed in parallel with n_jobs workers (-1 uses all 
+    CPUs). Threads are used by default, as the SciPy filtering routines 
+    release the GIL; set use_threads=False to use processes instead. Errors are 
+    reported per channel and columns are always in channel order.
+    """
     # Get all .continuous files in correct order
-    continuous_files = sorted([f for f in os.listdir(folder_path) 
-                             if f.startswith('100_CH') and f.endswith('.continuous')],
-                            key=lambda x: int(x.split('CH')[1].split('.')[0]))
+    continuous_files = get_continuous_files(folder_path)
     
     print(f"  Found {len(continuous_files)} continuous files")
     
+    # Process each channel
+    paths = [os.path.join(folder_path, file) for file in continuous_files]
+    args = (fs, target_fs, apply_filter)
+    n_workers = min(get_n_jobs(n_jobs), max(len(paths), 1))
+    if n_workers == 1:
+        results = [_process_channel_safe(path, *args) for path in paths]
+    else:
+        executor_class = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+        with executor_class(max_workers=n_workers) as executor:
+            results = list(executor.map(_process_channel_safe, paths, 
+                                        *[[arg] * len(paths) for arg in args]))
+
     # Initialize dictionary to store processed data
     processed_data = {}
     
-    # Process each channel
-    for file in continuous_files:
-        try:
-            # Extract channel name (e.g., 'CH1', 'CH2', etc.)
-            channel_name = f"CH{file.split('CH')[1].split('.')[0]}"
-            print(f"    Processing {channel_name}")
-            
-            full_path = os.path.join(folder_path, file)
-            downsampled_data = process_channel(full_path, fs, target_fs, 
-                                               apply_filter)
-            
-            # Store in dictionary
+    # Collect results in channel order
+    for file, (downsampled_data, error) in zip(continuous_files, results):
+        # Extract channel name (e.g., 'CH1', 'CH2', etc.)
+        channel_name = get_channel_name(file)
+        
+        if error is None:
+            print(f"    Processed {channel_name}")
             processed_data[channel_name] = downsampled_data
-            
-        except Exception as e:
-            print(f"Error processing {file}: {str(e)}")
+        else:
+            print(f"Error processing {file}: {str(error)}")
     
     # Create timestamps
     timestamps = np.arange(len(next(iter(processed_data.values())))) / target_fs
@@ -82,3 +350,122 @@ def process_all_channels(folder_path, fs=20000, target_fs=250,
     df = pd.DataFrame(processed_data)
     
     return df
+
+
+def _process_channel_safe(filename, fs, target_fs, apply_filter):
+    """Process a single channel file, returning (data, error)."""
+    try:
+        return process_channel(filename, fs, target_fs, apply_filter), None
+    except Exception as e:
+        return None, e
+
+
+def process_all_channels_to_parquet(folder_path, fname_out, fs=20000, 
+                                    target_fs=250, chunk_size=2**20, 
+                                    dtype=np.float64, compression='snappy',
+                                    n_jobs=1):
+    """Process all continuous files in the folder and stream them to Parquet.
+
+    Instead of building one DataFrame for the whole probe, all channels are 
+    downsampled together in time chunks of about chunk_size input samples 
+    (each channel with its own StreamingResampler), and each chunk is appended 
+    to the Parquet file as a row group as soon as it is produced. Peak memory 
+    is therefore one time chunk of all channels, independent of the recording 
+    length. The file has the same columns as process_all_channels() 
+    ('CH1', ..., 'time'). Requires pyarrow.
+
+    Parameters
+    ----------
+    folder_path : str
+        Folder containing the .continuous files.
+    fname_out : str
+        Output Parquet filename.
+    fs, target_fs : float
+        Original and target sampling frequencies (Hz).
+    chunk_size : int, optional
+        Approximate number of input samples per channel in each chunk.
+    dtype : np.dtype, optional
+        Data type of the channel columns, by default np.float64 (np.float32 
+        halves the file size).
+    compression : str, optional
+        Parquet compression codec ('snappy', 'zstd', 'gzip', None, ...).
+    n_jobs : int, optional
+        Number of threads used to process the channels of each chunk.
+
+    Returns
+    -------
+    channel_names : list of str
+        Names of the channels written.
+    n_samples : int
+        Number of (downsampled) samples written per channel.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Open all channels, skipping files that cannot be read
+    continuous_files = get_continuous_files(folder_path)
+    print(f"  Found {len(continuous_files)} continuous files")
+    channels = {}
+    for file in continuous_files:
+        try:
+            header, records = load_continuous(os.path.join(folder_path, file))
+            gaps = find_continuous_gaps(records)
+            if len(gaps):
+                print(f"    Warning: {len(gaps)} gaps found in {file}")
+            channels[get_channel_name(file)] = \
+                (records['samples'], header.get('bitVolts', 1.0))
+        except Exception as e:
+            print(f"Error processing {file}: {str(e)}")
+    if not channels:
+        raise ValueError(f"No readable continuous files in {folder_path}")
+
+    # All channels must be processed over the same records
+    n_records = min(len(samples) for samples, _ in channels.values())
+    if any(len(samples) != n_records for samples, _ in channels.values()):
+        print(f"    Warning: channels differ in length; keeping the first "
+              f"{n_records} records")
+    block_length = next(iter(channels.values()))[0].shape[1]
+    n_block = max(1, chunk_size // block_length)
+
+    # Schema: one column per channel, then time
+    schema = pa.schema([(name, pa.from_numpy_dtype(np.dtype(dtype))) 
+                        for name in channels] + [('time', pa.float64())])
+    resamplers = {name: StreamingResampler(fs, target_fs) for name in channels}
+
+    def process(name, i_start):
+        samples, gain = channels[name]
+        if i_start is None:
+            return resamplers[name].flush()
+        block = samples[i_start:min(i_start + n_block, n_records)]
+        return resamplers[name].process(block.reshape(-1) * gain)
+
+    # Process time chunks and append each one as a row group
+    n_samples = 0
+    starts = list(range(0, n_records, n_block)) + [None]
+    with ThreadPoolExecutor(max_workers=get_n_jobs(n_jobs)) as executor, \
+            pq.ParquetWriter(fname_out, schema, compression=compression) as writer:
+        for i_chunk, i_start in enumerate(starts):
+            columns = list(executor.map(process, channels, 
+                                        [i_start] * len(channels)))
+            n_chunk = len(columns[0])
+            if n_chunk == 0:
+                continue
+            time = (n_samples + np.arange(n_chunk)) / target_fs
+            columns = [column.astype(dtype) for column in columns] + [time]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            n_samples += n_chunk
+            print(f"    Wrote chunk {i_chunk + 1}/{len(starts)}")
+
+    return list(channels), n_samples
+
+
+def get_continuous_files(folder_path):
+    """Get all .continuous files in the folder, sorted by channel number."""
+    return sorted([f for f in os.listdir(folder_path) 
+                   if f.startswith('100_CH') and f.endswith('.continuous')],
+                  key=lambda x: int(x.split('CH')[1].split('.')[0]))
+
+
+def get_channel_name(file):
+    """Extract channel name (e.g., 'CH1', 'CH2', etc.) from a filename."""
+    return f"CH{file.split('CH')[1].split('.')[0]}"
@@ -4,44 +4,301 @@ Spectral analysis functions.
 
 # imports
 import numpy as np
-from scipy.signal import welch
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as sp_fft
+from scipy.fft import rfftfreq
+from scipy.signal import get_window
 import matplotlib.pyplot as plt
 
+import sys
+sys.path.append("code")
+from settings import N_JOBS
+from utils import iter_chunks
 
-def compute_spectra(data, fs, nperseg=2**12):
+
+def compute_spectra(data, fs, nperseg=2**12, dtype=np.float64, 
+                    fft_backend='scipy', workers=None, chunk_size=None):
     """Compute power spectra using Welch's method.
 
+    All channels (and epochs) are processed together, segment by segment, 
+    with results matching scipy.signal.welch (Hann window, 50% overlap, 
+    constant detrending, one-sided density scaling).
+
+    Recordings larger than memory can be processed in chunks of time by 
+    setting chunk_size, or by passing a filename or an iterable of chunks as 
+    data (see utils.iter_chunks). Chunks are accumulated with a 
+    WelchAccumulator, which returns the same result as the in-memory version.
+
     Parameters
     ----------
-    data : np.array
-        2D array of shape (n_channels, n_samples)
+    data : np.array, str or iterable
+        Array of shape (n_samples,), (n_channels, n_samples) or 
+        (n_epochs, n_channels, n_samples). In streaming mode, may also be a 
+        .npy or .parquet filename, or an iterable yielding chunks of shape 
+        (..., n_chunk_samples).
     fs : float
         Sampling frequency in Hz
     nperseg : int
         Length of each segment for Welch's method
+    dtype : np.dtype, optional
+        Precision of the computation, by default np.float64. Use np.float32 to 
+        halve memory and speed up the FFTs.
+    fft_backend : {'scipy', 'numpy'} or callable, optional
+        FFT implementation, by default 'scipy'. A callable must have the 
+        signature rfft(x, axis=-1).
+    workers : int, optional
+        Number of workers for the scipy.fft backend. Defaults to N_JOBS.
+    chunk_size : int, optional
+        Number of samples per chunk in streaming mode. Streaming mode is used 
+        if chunk_size is set or data is not an array.
 
     Returns
     -------
-    spectra : list of np.array
-        List of power spectra for each channel
-    freq : np.array
+    freqs : np.array
         Frequencies corresponding to the power spectra
+    spectra : np.array
+        Power spectra of shape (..., n_freqs), matching the leading dimensions 
+        of data
     """
-    if data.ndim == 1:
-        freqs, spectra = welch(data, fs=fs, nperseg=nperseg)
 
-    elif data.ndim == 2:
-        # init
-        freqs, _ = welch(data[0], fs=fs, nperseg=nperseg)
-        spectra = np.zeros((data.shape[0], len(freqs)))
+    # streaming mode
+    if chunk_size is not None or not isinstance(data, np.ndarray):
+        accumulator = WelchAccumulator(fs, nperseg, dtype, fft_backend, workers)
+        for chunk in iter_chunks(data, chunk_size or 2**20):
+            accumulator.update(chunk)
+        return accumulator.get_spectra()
+
+    # segment settings
+    data = np.asarray(data)
+    nperseg = min(nperseg, data.shape[-1])
+    window, step, scale = _get_welch_params(nperseg, fs, dtype)
+    n_segments = (data.shape[-1] - nperseg) // step + 1
 
-        # compute spectra
-        for i_chan in range(data.shape[0]):
-            _, spectra[i_chan] = welch(data[i_chan], fs=fs, nperseg=nperseg)
+    # average periodograms across segments, in blocks of segments to bound
+    # memory use
+    segments = sliding_window_view(data, nperseg, axis=-1)[..., ::step, :]
+    block_size = max(1, 2**24 // (segments[..., 0, :].size))
+    spectra = 0
+    for i_start in range(0, n_segments, block_size):
+        block = segments[..., i_start:i_start + block_size, :]
+        spectra = spectra + np.sum(
+            _compute_periodograms(block, window, scale, fft_backend, workers), 
+            axis=-2)
+    spectra = spectra / n_segments
+    freqs = rfftfreq(nperseg, 1 / fs)
 
     return freqs, spectra
 
 
+def compute_spectrogram(data, fs, window, hop=None, nperseg=2**12, 
+                        dtype=np.float64, fft_backend='scipy', workers=None):
+    """Compute rolling power spectra (Welch's method) over long recordings.
+
+    The periodogram of each segment of the recording is computed once and 
+    shared by all windows that contain it, so overlapping windows do not 
+    recompute overlapping segments. Each window's spectrum is the average of 
+    the segments that lie entirely within it; when hop is a multiple of 
+    nperseg // 2, this equals compute_spectra() applied to the window.
+
+    Segments start every nperseg // 2 samples from the start of the recording,
+    so every window must contain at least one complete segment: this holds 
+    when hop is a multiple of nperseg // 2, or for any hop when 
+    window >= nperseg + nperseg // 2 - 1. Otherwise a ValueError is raised.
+
+    Parameters
+    ----------
+    data : np.array
+        Array of shape (n_samples,), (n_channels, n_samples) or 
+        (n_epochs, n_channels, n_samples). May be an np.memmap; segments are 
+        read in blocks.
+    fs : float
+        Sampling frequency in Hz
+    window : int
+        Length of each window (samples)
+    hop : int, optional
+        Step between the start of consecutive windows (samples). Defaults to 
+        window (non-overlapping windows).
+    nperseg : int
+        Length of each segment for Welch's method
+    dtype, fft_backend, workers : optional
+        See compute_spectra().
+
+    Returns
+    -------
+    freqs : np.array
+        Frequencies corresponding to the power spectra
+    times : np.array
+        Time of the center of each window (s)
+    spectrogram : np.array
+        Power spectra of shape (..., n_windows, n_freqs)
+    """
+
+    # segment settings
+    data = np.asarray(data)
+    hop = window if hop is None else hop
+    nperseg = min(nperseg, window)
+    win, step, scale = _get_welch_params(nperseg, fs, dtype)
+    n_segments = (data.shape[-1] - nperseg) // step + 1
+    segments = sliding_window_view(data, nperseg, axis=-1)[..., ::step, :]
+
+    # segments contained in each window [seg_first, seg_stop)
+    starts = np.arange(0, data.shape[-1] - window + 1, hop)
+    seg_first = -(-starts // step)
+    seg_stop = (starts + window - nperseg) // step + 1
+    if np.any(seg_stop <= seg_first):
+        raise ValueError(f"Some windows contain no complete segment: use a hop "
+                         f"that is a multiple of {step} samples, or a window of "
+                         f"at least {nperseg + step - 1} samples")
+
+    # add each block of segment periodograms to every window containing it
+    spectrogram = np.zeros((*data.shape[:-1], len(starts), nperseg // 2 + 1))
+    block_size = max(1, 2**24 // (segments[..., 0, :].size))
+    for i_start in range(0, n_segments, block_size):
+        i_stop = min(i_start + block_size, n_segments)
+        periodograms = _compute_periodograms(segments[..., i_start:i_stop, :], 
+                                             win, scale, fft_backend, workers)
+        cumsum = np.cumsum(periodograms, axis=-2)
+        cumsum = np.concatenate([np.zeros_like(cumsum[..., :1, :]), cumsum], 
+                                axis=-2)
+
+        # windows overlapping this block
+        lo = np.maximum(seg_first, i_start)
+        hi = np.minimum(seg_stop, i_stop)
+        i_windows = np.flatnonzero(lo < hi)
+        spectrogram[..., i_windows, :] += \
+            cumsum[..., hi[i_windows] - i_start, :] - \
+            cumsum[..., lo[i_windows] - i_start, :]
+
+    spectrogram /= (seg_stop - seg_first)[:, None]
+    freqs = rfftfreq(nperseg, 1 / fs)
+    times = (starts + window / 2) / fs
+
+    return freqs, times, spectrogram
+
+
+class WelchAccumulator:
+    """
+    Accumulate a Welch power spectrum from consecutive chunks of a recording.
+
+    Samples that do not yet complete a segment are carried over to the next 
+    chunk, so segments spanning chunk boundaries are handled exactly as in 
+    compute_spectra() and the result matches the in-memory computation.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency in Hz
+    nperseg : int
+        Length of each segment for Welch's method
+    dtype, fft_backend, workers : optional
+        See compute_spectra().
+
+    Examples
+    --------
+    >>> accumulator = WelchAccumulator(fs=250, nperseg=2**12)
+    >>> for chunk in iter_chunks('recording.parquet'):
+    ...     accumulator.update(chunk)
+    >>> freqs, spectra = accumulator.get_spectra()
+    """
+
+    def __init__(self, fs, nperseg=2**12, dtype=np.float64, fft_backend='scipy',
+                 workers=None):
+        self.fs = fs
+        self.nperseg = nperseg
+        self.dtype = dtype
+        self.fft_backend = fft_backend
+        self.workers = workers
+
+        self.window, self.step, self.scale = _get_welch_params(nperseg, fs, 
+                                                               dtype)
+        self.buffer = None
+        self.power_sum = 0
+        self.n_segments = 0
+
+    def update(self, chunk):
+        """Add the next chunk of samples, of shape (..., n_chunk_samples)."""
+
+        # append chunk to samples carried over from the previous chunk
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        if self.buffer is not None:
+            chunk = np.concatenate([self.buffer, chunk], axis=-1)
+
+        # process all complete segments
+        n_segments = max(0, (chunk.shape[-1] - self.nperseg) // self.step + 1)
+        if n_segments:
+            segments = sliding_window_view(chunk, self.nperseg, axis=-1)
+            segments = segments[..., :n_segments * self.step:self.step, :]
+            self.power_sum = self.power_sum + np.sum(_compute_periodograms(
+                segments, self.window, self.scale, self.fft_backend, 
+                self.workers), axis=-2)
+            self.n_segments += n_segments
+
+        # carry over samples from the start of the next segment
+        self.buffer = chunk[..., n_segments * self.step:]
+
+    def get_spectra(self):
+        """
+        Return the frequencies and the power spectra averaged over all segments 
+        so far.
+        """
+
+        # recordings shorter than one segment are treated as a single segment,
+        # as in compute_spectra()
+        if self.n_segments == 0:
+            if self.buffer is None or self.buffer.shape[-1] == 0:
+                raise ValueError("No samples have been added.")
+            return compute_spectra(self.buffer, self.fs, self.nperseg, 
+                                   self.dtype, self.fft_backend, self.workers)
+
+        freqs = rfftfreq(self.nperseg, 1 / self.fs)
+        spectra = self.power_sum / self.n_segments
+
+        return freqs, spectra
+
+
+def _get_welch_params(nperseg, fs, dtype=np.float64):
+    """Window, step between segments and density scaling for Welch's method."""
+
+    window = get_window('hann', nperseg).astype(dtype)
+    step = nperseg - nperseg // 2
+    scale = 1.0 / (fs * np.sum(window**2))
+
+    return window, step, scale
+
+
+def _compute_periodograms(segments, window, scale, fft_backend='scipy', 
+                          workers=None):
+    """
+    Compute the one-sided periodogram of each segment (last axis) after 
+    removing the mean and applying the window.
+    """
+
+    # detrend and window
+    segments = np.asarray(segments, dtype=window.dtype)
+    segments = (segments - np.mean(segments, axis=-1, keepdims=True)) * window
+
+    # compute FFT
+    if fft_backend == 'scipy':
+        spectrum = sp_fft.rfft(segments, axis=-1, 
+                               workers=N_JOBS if workers is None else workers)
+    elif fft_backend == 'numpy':
+        spectrum = np.fft.rfft(segments, axis=-1)
+    elif callable(fft_backend):
+        spectrum = fft_backend(segments, axis=-1)
+    else:
+        raise ValueError("fft_backend must be 'scipy', 'numpy' or a callable")
+
+    # one-sided power spectral density
+    periodograms = (spectrum.real**2 + spectrum.imag**2) * scale
+    nperseg = segments.shape[-1]
+    if nperseg % 2:
+        periodograms[..., 1:] *= 2
+    else:
+        periodograms[..., 1:-1] *= 2
+
+    return periodograms
+
+
 def plot_spectra(freqs, spectra, shade_sem=True, ax=None, color='k',
                  title=None, fname=None):
 
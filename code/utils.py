@@ -2,6 +2,7 @@
 Utility functions.
 """
 
+import os
 import numpy as np
 
 
@@ -70,3 +71,75 @@ def shift_signals(signals, std=5):
         signals[ii] = signals[ii] + (shift * ii)
 
     return signals
+
+
+def get_n_jobs(n_jobs):
+    """
+    Convert an n_jobs setting into a number of worker processes.
+
+    Parameters
+    ----------
+    n_jobs : int
+        Number of jobs. Follows the joblib convention: -1 uses all CPUs, -2 
+        uses all CPUs but one, etc.
+    
+    Returns
+    -------
+    int
+        Number of workers (at least 1).
+    """
+
+    n_cpus = os.cpu_count() or 1
+    if n_jobs is None or n_jobs == 0:
+        n_jobs = 1
+    elif n_jobs < 0:
+        n_jobs = n_cpus + 1 + n_jobs
+
+    return max(1, min(n_jobs, n_cpus))
+
+
+def iter_chunks(source, chunk_size=2**20, columns=None):
+    """
+    Iterate over a (possibly larger than memory) recording in chunks of time.
+
+    Parameters
+    ----------
+    source : np.array, str or iterable
+        Recording to iterate over. Can be an array (or np.memmap) of shape 
+        (..., n_samples), the filename of a .npy file (memory-mapped) or of a 
+        Parquet file with one column per channel (read one batch of rows at a 
+        time; requires pyarrow), or an iterable that already yields chunks.
+    chunk_size : int, optional
+        Number of samples per chunk, by default 2**20.
+    columns : list of str, optional
+        Parquet columns to read. Defaults to all columns except 'time'.
+
+    Yields
+    ------
+    np.array
+        Chunk of shape (..., n_chunk_samples).
+    """
+
+    # load files
+    if isinstance(source, str) and source.endswith('.npy'):
+        source = np.load(source, mmap_mode='r')
+
+    elif isinstance(source, str) and source.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(source)
+        if columns is None:
+            columns = [name for name in parquet_file.schema_arrow.names 
+                       if name != 'time']
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, 
+                                               columns=columns):
+            yield np.stack([column.to_numpy(zero_copy_only=False) 
+                            for column in batch.columns])
+        return
+
+    # iterate over arrays, or pass through iterables of chunks
+    if isinstance(source, np.ndarray):
+        for i_start in range(0, source.shape[-1], chunk_size):
+            yield source[..., i_start:i_start + chunk_size]
+    else:
+        yield from source
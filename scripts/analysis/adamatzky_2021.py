@@ -46,11 +46,11 @@ def main():
         np.savez(f"{path_out}/psd/{fname_out}", spectra=spectra, freqs=freqs)
 
         # compute spectral exponent and complexity
-        exponent[ii] = compute_exponent(spectra, freqs)
+        exponent[ii] = compute_exponent(spectra, freqs, cache=True)
         complexity[ii] = compute_complexity(signals)
 
         # compute timescale
-        timescale[ii] = compute_timescale(signals, FS)
+        timescale[ii] = compute_timescale(signals, FS, cache=True)
 
     # save results
     np.save("data/adamatzky_2021/results/exponent.npy", exponent)
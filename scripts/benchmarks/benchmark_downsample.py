@@ -0,0 +1,64 @@
+"""
+Benchmark polyphase downsampling against the original filtfilt + decimate
+implementation of sp_utils.downsample.
+
+A synthetic 20 kHz trace (1/f noise plus a slow oscillation) is downsampled to
+each target sampling frequency with both methods. Run time, output length and
+the RMS difference between the two outputs (relative to the RMS of the
+original-method output) are reported.
+
+Usage:
+python scripts/benchmarks/benchmark_downsample.py
+python scripts/benchmarks/benchmark_downsample.py --duration 600 --target_fs 100 250 300
+
+"""
+
+# imports - standard
+import argparse
+from time import perf_counter
+import numpy as np
+
+# imports - custom
+import sys
+sys.path.append("code")
+from sp_utils import downsample
+
+
+def main():
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Benchmark downsampling.')
+    parser.add_argument('--duration', type=float, default=60,
+                        help='Duration of the synthetic trace (seconds). Default is 60')
+    parser.add_argument('--fs', type=int, default=20000,
+                        help='Original sampling frequency (Hz). Default is 20000')
+    parser.add_argument('--target_fs', type=float, nargs='+', default=[100, 250],
+                        help='Target sampling frequencies (Hz). Default is 100 250')
+    args = parser.parse_args()
+
+    # simulate trace: 1/f noise plus a 1 Hz oscillation, stored as int16
+    rng = np.random.default_rng(0)
+    n_samples = int(args.duration * args.fs)
+    trace = np.cumsum(rng.standard_normal(n_samples)) * 0.1
+    trace += 100 * np.sin(2 * np.pi * np.arange(n_samples) / args.fs)
+    trace = (trace - np.mean(trace)).astype(np.int16)
+
+    # run benchmark
+    print(f"{'target_fs':>10} {'method':>10} {'time (s)':>9} {'n_out':>9} {'rel. diff':>10}")
+    for target_fs in args.target_fs:
+        results = {}
+        for method in ['decimate', 'polyphase']:
+            t_start = perf_counter()
+            results[method] = downsample(trace, args.fs, target_fs, method=method)
+            t_elapsed = perf_counter() - t_start
+
+            # compare to original method
+            reference = results['decimate']
+            n_out = min(len(reference), len(results[method]))
+            diff = np.sqrt(np.mean((results[method][:n_out] - reference[:n_out])**2))
+            diff /= np.sqrt(np.mean(reference[:n_out]**2))
+            print(f"{target_fs:>10g} {method:>10} {t_elapsed:>9.3f} "
+                  f"{len(results[method]):>9} {diff:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark the trie-based Lempel-Ziv complexity engine against the original
+set-based implementation.
+
+Random binary sequences of increasing length (1e3 to 1e8 samples by default) are
+generated and the run time of each implementation is reported. The counts
+returned by both implementations are compared to confirm they are identical.
+The reference implementation is skipped for sequences longer than
+--max_ref_samples, as it becomes prohibitively slow.
+
+Usage:
+python scripts/benchmarks/benchmark_lempel_ziv.py
+python scripts/benchmarks/benchmark_lempel_ziv.py --max_exp 7 --max_ref_samples 1000000
+
+"""
+
+# imports - standard
+import argparse
+from time import perf_counter
+import numpy as np
+
+# imports - custom
+import sys
+sys.path.append("code")
+from analysis import lempel_ziv_complexity, lempel_ziv_complexity_reference
+
+
+def main():
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Benchmark Lempel-Ziv complexity.')
+    parser.add_argument('--min_exp', type=int, default=3,
+                        help='Shortest sequence length (power of 10). Default is 3')
+    parser.add_argument('--max_exp', type=int, default=8,
+                        help='Longest sequence length (power of 10). Default is 8')
+    parser.add_argument('--max_ref_samples', type=int, default=10**7,
+                        help='Longest sequence to run the reference implementation on. Default is 1e7')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed. Default is 0')
+    args = parser.parse_args()
+
+    # run benchmark
+    rng = np.random.default_rng(args.seed)
+    print(f"{'n_samples':>12} {'trie (s)':>10} {'reference (s)':>14} {'speedup':>8} {'match':>6}")
+    for exponent in range(args.min_exp, args.max_exp + 1):
+        n_samples = 10**exponent
+        binary_array = rng.integers(0, 2, n_samples, dtype=np.uint8)
+
+        # time trie implementation
+        t_start = perf_counter()
+        lzc = lempel_ziv_complexity(binary_array)
+        t_trie = perf_counter() - t_start
+
+        # time reference implementation
+        if n_samples <= args.max_ref_samples:
+            t_start = perf_counter()
+            lzc_ref = lempel_ziv_complexity_reference(binary_array)
+            t_ref = perf_counter() - t_start
+            print(f"{n_samples:>12} {t_trie:>10.3f} {t_ref:>14.3f} "
+                  f"{t_ref/t_trie:>8.1f} {str(lzc == lzc_ref):>6}")
+        else:
+            print(f"{n_samples:>12} {t_trie:>10.3f} {'skipped':>14} "
+                  f"{'-':>8} {'-':>6}")
+
+
+if __name__ == "__main__":
+    main()
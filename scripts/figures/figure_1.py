@@ -19,6 +19,7 @@ from timescales.fit import ACF
 import sys
 sys.path.append("code")
 from utils import shift_signals
+from recording import Recording
 from plots import beautify_ax
 
 # settings
@@ -33,9 +34,7 @@ def main():
     print("Importing data...")
 
     # load signals
-    data_in = np.load(f"data/manuscript/signals_fungal.npz")
-    signals = data_in['signals']
-    time = data_in['time']
+    signals, time = Recording("data/manuscript/signals_fungal.npz").get_data()
 
     # load example spectra
     data_in = np.load(f"data/manuscript/spectra_fungal.npz")
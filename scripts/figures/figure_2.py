@@ -19,6 +19,7 @@ import sys
 sys.path.append("code")
 from analysis import compute_exponent, compute_timescale
 from utils import shift_signals
+from recording import Recording
 from plots import plot_spectra, beautify_ax
 
 # settings
@@ -39,9 +40,8 @@ def main():
         if kingdom == 'plant': continue
 
         # load signals
-        data_in = np.load(f"data/manuscript/signals_{kingdom}.npz")
-        signals[kingdom] = data_in['signals']
-        time[kingdom] = data_in['time']
+        recording = Recording(f"data/manuscript/signals_{kingdom}.npz")
+        signals[kingdom], time[kingdom] = recording.get_data()
 
         # load example spectra
         data_in = np.load(f"data/manuscript/spectra_{kingdom}.npz")
@@ -55,8 +55,10 @@ def main():
     exponent, timescale = {}, {}
     df = pd.DataFrame()
     for ii, kingdom in enumerate(['fungal', 'human']):
-        timescale[kingdom] = compute_timescale(signals[kingdom], FS[kingdom])
-        exponent[kingdom] = compute_exponent(spectra[kingdom], freqs[kingdom])
+        timescale[kingdom] = compute_timescale(signals[kingdom], FS[kingdom],
+                                               cache=True)
+        exponent[kingdom] = compute_exponent(spectra[kingdom], freqs[kingdom],
+                                             cache=True)
         df = pd.concat([df, pd.DataFrame({'kingdom': kingdom, 
                                           'exponent': exponent[kingdom], 
                                           'timescale': timescale[kingdom]})])
@@ -1,9 +1,12 @@
 """
 This script records data from a PicoLog ADC24 data logger using the PicoHRDL
-library. The script is written to record data from a single channel in chunks of
-300 samples, saving each chunk to a text file. The script is written to
+library. The script is written to record data from one or more channels in chunks of
+300 samples, saving each chunk to a text file (one column per channel). The script is written to
 record data in the differential set-up.
 
+The logger samples in streaming mode on its own clock (every DT ms), and blocks
+of samples are read with HRDLGetValues (see code/pico_acquisition.py).
+
 Adaptred from: Mishra et al. 2024, doi: 10.5281/zenodo.12810869
 Originally adapted from: PicoTech, https://github.com/picotech/picosdk-python-wrappers/blob/master/picohrdlExamples/picohrdlSingleModeExample.py
 
@@ -12,19 +15,20 @@ Originally adapted from: PicoTech, https://github.com/picotech/picosdk-python-wr
 # SETTINGS #####################################################################
 DIR_OUT = "20250127_control" # Output folder within data/recordings
 DT = 100 # Sampling frequency in milliseconds
-CHANNEL = 3 # Channel to record from - script written for differential recording so this is the odd-numbered channel
+CHANNELS = [3] # Channels to record from - script written for differential recording so these are the odd-numbered channels (several pairs are recorded simultaneously)
 DURATION = 60 * 10 # Duration of recording in seconds
 N_SAMPLES_CHUNK = 300 # Number of samples to record before saving to file
-VMAX = 39000  # Maximum voltage in microvolts (Mishra et al. 2024 used 39000)
-VOLTAGE_RANGE = 39 # Voltage range in millivolts (see function voltage_key below for options)
+VMAX = None  # Maximum voltage in microvolts, one value per VOLTAGE_RANGE (None: voltage range * 1000; Mishra et al. 2024 used 39000)
+VOLTAGE_RANGE = 39 # Voltage range in millivolts (2500, 1250, 625, 313, 156, 78 or 39), or a list with one range per channel
+SIMULATE = False # Record from a simulated data logger (for testing without the device)
 
 fs = int(1000 / DT)
 n_samples = int(DURATION *fs)
-n_chunks = int(n_samples / N_SAMPLES_CHUNK)
+n_chunks = (n_samples + N_SAMPLES_CHUNK - 1) // N_SAMPLES_CHUNK # last chunk may be shorter
 
 # Print settings
 print("\nRecording settings:")
-print(f"  Recording from channel {CHANNEL} in differential mode")
+print(f"  Recording from channels {CHANNELS} in differential mode")
 print(f"  Voltage range: {VOLTAGE_RANGE} mV")
 print(f"  Sampling frequency: {fs} Hz ({DT} ms intervals)")
 print(f"  Total recording time: {DURATION} seconds")
@@ -35,102 +39,40 @@ print(f"  Saving {N_SAMPLES_CHUNK} samples per file ({n_chunks} files total)")
 print("\nSetting up data logger...")
 
 # imports
-import ctypes
+import os
 import numpy as np
-from picosdk.picohrdl import picohrdl as hrdl
-from picosdk.functions import assert_pico2000_ok
 import time
 
-# create function that maps these valtages to the corresponding values
-def voltage_key(s):
-    return {
-        39: 6,
-        78: 5,
-        156: 4,
-        313: 3,
-        625: 2,
-        1250: 1,
-        2500: 0
-    }[s]
+import sys
+sys.path.append("code")
+from pico_acquisition import PicoLogStream, FakeHRDL, get_hrdl
 
 # SET-UP DATA LOGGER ###########################################################
-# print("\nSetting up data logger...")
-
-# Create chandle and status ready for use
-chandle = ctypes.c_int16()
-status = {}
-
-# Open unit
-status["openUnit"] = hrdl.HRDLOpenUnit()
-assert_pico2000_ok(status["openUnit"])
-chandle = status["openUnit"]
-
-# Set mains noise rejection to reject 50 Hz mains noise
-status["mainsRejection"] = hrdl.HRDLSetMains(chandle, 0)
-assert_pico2000_ok(status["mainsRejection"])
-
-# Disable corresponding even-numbered channel to enable differential recording
-status["disableDifferentialChannel"] = \
-    hrdl.HRDLSetAnalogInChannel(chandle, CHANNEL+1, 0, 
-                                voltage_key(VOLTAGE_RANGE), 0)
-status["disableDifferentialChannel"] = \
-    hrdl.HRDLSetAnalogInChannel(chandle, CHANNEL, 1, 
-                                voltage_key(VOLTAGE_RANGE), 0)
-
-# Compute voltage scaling ######################################################
-# print("\nComputing voltage scaling...")
-
-# Set single reading parameters
-range_ = hrdl.HRDL_VOLTAGERANGE[f"HRDL_{VOLTAGE_RANGE}_MV"]
-conversionTime = hrdl.HRDL_CONVERSIONTIME[f"HRDL_{DT}MS"]
-overflow = ctypes.c_int16(0)
-value = ctypes.c_int32()
-
-# Get the minimum and maximum ADC values for scaling
-max_value = ctypes.c_int32()
-min_value = ctypes.c_int32()
-hrdl.HRDLGetMinMaxAdcCounts(chandle, ctypes.byref(min_value), 
-                            ctypes.byref(max_value), CHANNEL)
-print("  Max ADC Value:", max_value.value)
-print("  Min ADC Value:", min_value.value)
-
-# Calculate voltage from ADC value
-raw_ADC_value = value.value
-max_ADC_Value = max_value.value
-V = (raw_ADC_value / max_ADC_Value) * VMAX
-print("  Voltage:", V)
+# Open unit, set mains noise rejection (50 Hz), enable the differential channel
+# and set the sampling interval
+hrdl = FakeHRDL() if SIMULATE else get_hrdl()
+logger = PicoLogStream(hrdl, CHANNELS, voltage_range=VOLTAGE_RANGE, dt=DT,
+                       vmax=VMAX)
+logger.open()
+print("  Max ADC Values:", logger.max_adc)
 
 # RECORD DATA ##################################################################
-# Initialize data saving parameters
-save_data = []
+os.makedirs(f"data/recordings/{DIR_OUT}", exist_ok=True)
 start_time = time.time()
-count = 0
 
-# Collect and save data in chunks of 300 samples
+# Stream data from the logger and save in chunks of N_SAMPLES_CHUNK samples
 print("\nRecording data...")
-for i in range(n_samples):
-    status["getSingleValue"] = hrdl.HRDLGetSingleValue(
-        chandle, CHANNEL, range_, conversionTime, 0, ctypes.byref(overflow), 
-        ctypes.byref(value)
-    )
-    value_data = value.value
-    V = (float(value_data) / float(max_ADC_Value)) * float(VMAX)
-    save_data.append(V)
-    
-    if len(save_data) == N_SAMPLES_CHUNK:
-        np.savetxt(f"data/recordings/{DIR_OUT}/{count}.txt", save_data, 
-                   delimiter=',')
+try:
+    for count, chunk in enumerate(logger.iter_chunks(n_samples, N_SAMPLES_CHUNK)):
+        np.savetxt(f"data/recordings/{DIR_OUT}/{count}.txt",
+                   logger.to_voltage(chunk).T, delimiter=',')
         print(f"  Saved chunk {count+1}/{n_chunks}")
-        count += 1
-        save_data = []
+finally:
+    # Close unit
+    logger.close()
 
 # Print the elapsed time
 print(f"--- {time.time() - start_time} seconds ---")
 print("\nRecording complete")
-
-# Close unit
-status["closeUnit"] = hrdl.HRDLCloseUnit(chandle)
-assert_pico2000_ok(status["closeUnit"])
-
-# Print final status
-print("\nStatus:", status)
+if logger.n_overflows:
+    print(f"  Warning: input exceeded the voltage range in {logger.n_overflows} reads")
@@ -1,6 +1,15 @@
 """
 This script records data from a PicoLog ADC24 data logger using the PicoHRDL
-library. The script is written to record data in the differential set-up.
+library. The script is written to record data in the differential set-up, from
+one or more channels sampled in the same acquisition pass (one column per
+channel in the output file).
+
+The logger samples in streaming mode on its own clock (every DT ms), and blocks
+of samples are read with HRDLGetValues (see code/pico_acquisition.py). Each
+block is flushed to an append-only binary recording (FNAME with a .bin
+extension), which is converted to FNAME at the end of the recording. If the
+recording is interrupted, the samples written so far can be recovered with
+scripts/picolog/recover_recording.py.
 
 Adaptred from: Mishra et al. 2024, doi: 10.5281/zenodo.12810869
 Originally adapted from: PicoTech, https://github.com/picotech/picosdk-python-wrappers/blob/master/picohrdlExamples/picohrdlSingleModeExample.py
@@ -9,11 +18,13 @@ Originally adapted from: PicoTech, https://github.com/picotech/picosdk-python-wr
 
 # SETTINGS #####################################################################
 FNAME = "data/recordings/20250220_lightdark.txt" # Output filename
-CHANNEL = 5 # channel to record - script written for differential recording; this is the odd-numbered channel
+CHANNELS = [5] # channels to record - script written for differential recording; these are the odd-numbered channels (several pairs are recorded simultaneously)
 DT = 100 # in milliseconds (1/FS)
 DURATION = 60 * 100 + 30 # duration of recording in seconds
-VOLTAGE_RANGE = 39 # voltage range in millivolts (see function voltage_key below for options)
+VOLTAGE_RANGE = 39 # voltage range in millivolts (2500, 1250, 625, 313, 156, 78 or 39), or a list with one range per channel
 N_DROP = 300 # number of samples to drop from the beginning of the recording
+N_SAMPLES_CHUNK = 300 # number of samples read from the data logger at a time
+SIMULATE = False # record from a simulated data logger (for testing without the device)
 
 # Compute sampling frequency and number of samples
 fs = 1000 / DT
@@ -21,7 +32,7 @@ n_samples = int(DURATION * fs + N_DROP)
 
 # Print settings
 print("\nRecording settings:")
-print(f"  Recording channels: \t{CHANNEL} and {CHANNEL+1} (differential mode)")
+print(f"  Recording channels: \t{', '.join(f'{ch} and {ch+1}' for ch in CHANNELS)} (differential mode)")
 print(f"  Output filename: \t'{FNAME}'")
 print(f"  Voltage range: \t{VOLTAGE_RANGE} mV")
 print(f"  Sampling frequency: \t{fs:0.1f} Hz ({DT} ms intervals)")
@@ -29,86 +40,47 @@ print(f"  Recording duration: \t{DURATION} seconds")
 
 # SET-UP #######################################################################
 # imports
-import ctypes
-import numpy as np
-from picosdk.picohrdl import picohrdl as hrdl
-from picosdk.functions import assert_pico2000_ok
+import os
 import time
 
-# create function that maps these valtages to the corresponding values
-def voltage_key(s):
-    return {
-        39: 6,
-        78: 5,
-        156: 4,
-        313: 3,
-        625: 2,
-        1250: 1,
-        2500: 0
-    }[s]
+import sys
+sys.path.append("code")
+from pico_acquisition import (PicoLogStream, FakeHRDL, get_hrdl,
+                              record_to_binary, recording_to_txt)
+
+# Binary recording, written during acquisition
+FNAME_BINARY = os.path.splitext(FNAME)[0] + '.bin'
+if FNAME_BINARY == FNAME:
+    raise ValueError("FNAME must not have a .bin extension (used for the binary recording)")
 
 # SET-UP DATA LOGGER ###########################################################
 print("\nSetting up data logger...")
 
-# Create chandle and status ready for use
-chandle = ctypes.c_int16()
-status = {}
-
-# Open unit
-status["openUnit"] = hrdl.HRDLOpenUnit()
-assert_pico2000_ok(status["openUnit"])
-chandle = status["openUnit"]
-
-# Set mains noise rejection to reject 50 Hz mains noise
-status["mainsRejection"] = hrdl.HRDLSetMains(chandle, 0)
-assert_pico2000_ok(status["mainsRejection"])
-
-# Disable corresponding even-numbered channel to enable differential recording
-status["disableDifferentialChannel"] = \
-    hrdl.HRDLSetAnalogInChannel(chandle, CHANNEL+1, 0, 
-                                voltage_key(VOLTAGE_RANGE), 0)
-status["enableDifferentialChannel"] = \
-    hrdl.HRDLSetAnalogInChannel(chandle, CHANNEL, 1, 
-                                voltage_key(VOLTAGE_RANGE), 0)
-
-# Compute voltage scaling ######################################################
-# Set single reading parameters
-range_ = hrdl.HRDL_VOLTAGERANGE[f"HRDL_{VOLTAGE_RANGE}_MV"]
-conversionTime = hrdl.HRDL_CONVERSIONTIME[f"HRDL_{DT}MS"]
-overflow = ctypes.c_int16(0)
-value = ctypes.c_int32()
-
-# Get the minimum and maximum ADC values for scaling
-max_value = ctypes.c_int32()
-min_value = ctypes.c_int32()
-hrdl.HRDLGetMinMaxAdcCounts(chandle, ctypes.byref(min_value), 
-                            ctypes.byref(max_value), CHANNEL)
+# Open unit, set mains noise rejection (50 Hz), enable the differential channel
+# and set the sampling interval
+hrdl = FakeHRDL() if SIMULATE else get_hrdl()
+logger = PicoLogStream(hrdl, CHANNELS, voltage_range=VOLTAGE_RANGE, dt=DT)
+logger.open()
 
 # RECORD DATA ##################################################################
 print("\nRecording data...")
-
-# Initialize data saving parameters
-reading = []
+print(f"  Writing to '{FNAME_BINARY}'")
 start_time = time.time()
 
-# Collect data
-for i in range(n_samples):
-    hrdl.HRDLGetSingleValue(chandle, CHANNEL, range_, conversionTime, 0, 
-                            ctypes.byref(overflow), ctypes.byref(value))
-    reading.append(value.value)
+# Collect data, flushing each chunk to the binary recording
+try:
+    record_to_binary(logger, FNAME_BINARY, n_samples, N_SAMPLES_CHUNK, n_drop=N_DROP)
+finally:
+    # Close unit
+    logger.close()
 
 # Print the elapsed time
 print(f"  Complete in {time.time() - start_time:0.2f} seconds")
+if logger.n_overflows:
+    print(f"  Warning: input exceeded the voltage range in {logger.n_overflows} reads")
 
 # Save the data
-voltage = np.array(reading) * (VOLTAGE_RANGE * 1000 / max_value.value)
-np.savetxt(FNAME, voltage[N_DROP:], delimiter=',')
+recording_to_txt(FNAME_BINARY, FNAME)
 print(f"  Saved data to '{FNAME}'")
 
-# Close unit
-status["closeUnit"] = hrdl.HRDLCloseUnit(chandle)
-assert_pico2000_ok(status["closeUnit"])
-
-# Print final status
-print("\nStatus:", status)
 print("\n--------- END ---------")
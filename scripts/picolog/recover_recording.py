@@ -0,0 +1,58 @@
+"""
+Recover a PicoLog recording from its binary file.
+
+picolog_recording_continuous.py flushes the samples to a binary recording
+(.bin) as they are acquired, and only converts it to text at the end. If the
+recording was interrupted (crash, power loss, Ctrl+C), this script converts the
+samples written so far (all complete samples in the file) to text, in the same
+format (voltage in uV, one sample per line and one column per channel).
+
+Usage:
+python scripts/picolog/recover_recording.py --fname data/recordings/20250220_lightdark.bin
+
+"""
+
+# imports - standard
+import os
+import argparse
+
+# imports - custom
+import sys
+sys.path.append("code")
+from binary_recording import read_binary_recording
+from pico_acquisition import recording_to_txt
+
+
+def main():
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Recover a PicoLog recording.')
+    parser.add_argument('--fname', type=str,
+                        help='Filename of the binary recording (.bin)')
+    parser.add_argument('--fname_out', type=str, default=None,
+                        help='Output text filename. Default is the input filename with a .txt extension')
+    parser.add_argument('--n_drop', type=int, default=None,
+                        help='Number of samples to drop from the beginning. Default is the value used for the recording')
+    args = parser.parse_args()
+    if args.fname is None:
+        raise ValueError("Please input a binary recording filename (--fname)")
+    fname_out = args.fname_out or os.path.splitext(args.fname)[0] + '.txt'
+    if os.path.realpath(fname_out) == os.path.realpath(args.fname):
+        raise ValueError("Output filename must differ from the binary recording "
+                         "(--fname_out)")
+
+    # print recording settings
+    header, frames = read_binary_recording(args.fname)
+    print("\nRecording settings:")
+    print(f"  Channels: \t\t{header['channels']} (differential mode)")
+    print(f"  Voltage range: \t{header['voltage_range']} mV")
+    print(f"  Sampling interval: \t{header['dt']} ms")
+    print(f"  Samples recovered: \t{len(frames)} "
+          f"({len(frames) * header['dt'] / 1000:0.1f} seconds)")
+
+    # convert to text
+    n_samples = recording_to_txt(args.fname, fname_out, n_drop=args.n_drop)
+    print(f"\nSaved {n_samples} samples to '{fname_out}'")
+
+
+if __name__ == "__main__":
+    main()
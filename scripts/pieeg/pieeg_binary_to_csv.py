@@ -0,0 +1,40 @@
+"""
+Convert a binary PiEEG-16 recording (pieeg_to_csv.py --format binary) to CSV,
+with the same columns as the CSV recording format.
+
+Usage:
+python scripts/pieeg/pieeg_binary_to_csv.py --fname <recording.bin>
+python scripts/pieeg/pieeg_binary_to_csv.py --fname <recording.bin> --fname_out <recording.csv>
+
+"""
+
+# imports - standard
+import os
+import argparse
+
+# imports - custom
+import sys
+sys.path.append('code')
+from binary_recording import binary_to_csv
+
+
+def main():
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Convert binary ephys data to CSV.')
+    parser.add_argument('--fname', type=str, 
+                        help='Filename of binary ephys data')
+    parser.add_argument('--fname_out', type=str, default=None,
+                        help='Output CSV filename. Default is the input filename with a .csv extension')
+    args = parser.parse_args()
+    if args.fname is None:
+        raise ValueError("Please input a filename (--fname)")
+    if args.fname_out is None:
+        args.fname_out = os.path.splitext(args.fname)[0] + '.csv'
+
+    # convert
+    n_frames = binary_to_csv(args.fname, args.fname_out)
+    print(f"Converted {n_frames} samples to {args.fname_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
 """
 Record data from PiEEG-16 and write to CSV
 
+With --format binary, samples are instead written as fixed-size binary frames
+(timestamp + 16 channels) to a preallocated, memory-mapped file, flushed in
+blocks (see code/binary_recording.py). Convert to CSV with
+scripts/pieeg/pieeg_binary_to_csv.py.
+
+With --mode threaded, SPI reads and disk writes run on separate threads (see
+code/pieeg_acquisition.py): samples are paced with a monotonic clock and
+buffered in a ring buffer, so that disk latency does not delay sampling. The
+number of late samples and of samples dropped because the buffer was full are
+reported at the end of the recording.
+
+With --mode drdy, samples are read on the falling edge of the ADS1299 DRDY line
+instead of being paced with a clock: every conversion is read once, at the
+chip's data rate (--fs must be one of 250, 500, 1000, 2000, 4000, 8000 or
+16000 Hz), and timestamped with the time of its edge. Conversions that could
+not be read in time are reported at the end of the recording.
+
 """
 
 # imports - standard
-import numpy as np
 import spidev
 from datetime import datetime
 from RPi import GPIO
@@ -17,7 +33,12 @@ import argparse
 # imports - custom
 import sys
 sys.path.append('code')
-from pieeg_utils import setup_pieeg16, get_voltage
+from pieeg_utils import setup_pieeg16, setup_drdy_line, decode_frames, DRDY_PIN
+from binary_recording import BinaryRecordingWriter
+from pieeg_acquisition import AcquisitionEngine, SpiFrameReader, DrdyFrameReader, CsvSink
+
+# settings
+COLUMNS = [f"chan_{i_chan}" for i_chan in range(1, 17)]
 
 
 def main():
@@ -31,6 +52,14 @@ def main():
                         help='Sampling frequency of the data (Hz). Default is 10 Hz')
     parser.add_argument('--gain', type=int, default=1,
                         help='Gain of the data (1, 2, 4, 6, 8, 12, or 24). Default is 1')
+    parser.add_argument('--format', type=str, default='csv', choices=['csv', 'binary'],
+                        help='Output format (csv or binary). Default is csv')
+    parser.add_argument('--block_size', type=int, default=256,
+                        help='Samples buffered between writes in binary format. Default is 256')
+    parser.add_argument('--mode', type=str, default='polled', choices=['polled', 'threaded', 'drdy'],
+                        help='Acquisition mode (polled, threaded or drdy). Default is polled')
+    parser.add_argument('--drdy_pin', type=int, default=DRDY_PIN,
+                        help=f'GPIO line of DRDY in drdy mode. Default is {DRDY_PIN}')
     args = parser.parse_args()
     if args.fname is None:
         raise ValueError("Please input an output filename (--fname)")
@@ -42,12 +71,44 @@ def main():
     print(f"    Duration: {args.duration} seconds")
     print(f"    Sampling frequency: {args.fs} Hz")
     print(f"    Gain: {args.gain}")
-    spi_1, spi_2, cs_line = setup_pieeg16(args.gain)
+    print(f"    Format: {args.format}")
+    print(f"    Mode: {args.mode}")
+    if args.mode == 'drdy':
+        spi_1, spi_2, cs_line = setup_pieeg16(args.gain, data_rate=args.fs)
+        drdy_line = setup_drdy_line(args.drdy_pin)
+    else:
+        spi_1, spi_2, cs_line = setup_pieeg16(args.gain)
+
+    # initialize output file for recording data
+    if args.format == 'binary':
+        writer = BinaryRecordingWriter(args.fname, COLUMNS, fs=args.fs, 
+                                       capacity=args.duration*args.fs, 
+                                       block_size=args.block_size, 
+                                       gain=args.gain)
+    elif args.mode in ['threaded', 'drdy']:
+        writer = CsvSink(args.fname, COLUMNS)
+    else:
+        columns = "time," + ",".join(COLUMNS) + "\n"
+        with open(args.fname, 'w') as f:
+            f.write(columns)
 
-    # initialize csv file for recording data
-    columns = "time,chan_1,chan_2,chan_3,chan_4,chan_5,chan_6,chan_7,chan_8,chan_9,chan_10,chan_11,chan_12,chan_13,chan_14,chan_15,chan_16\n"
-    with open(args.fname, 'w') as f:
-        f.write(columns)
+    # record data on separate reader and writer threads
+    if args.mode in ['threaded', 'drdy']:
+        print("\nRecording data...")
+        if args.mode == 'drdy':
+            reader = DrdyFrameReader(spi_1, spi_2, cs_line, drdy_line)
+        else:
+            reader = SpiFrameReader(spi_1, spi_2, cs_line)
+        engine = AcquisitionEngine(reader, writer.write, args.fs, gain=args.gain)
+        engine.run(args.duration)
+        writer.close()
+        stats = engine.get_stats()
+        print(f"  {stats['n_written']} samples written, {stats['n_late']} late, "
+              f"{stats['n_overruns']} dropped (buffer overrun)")
+        if args.mode == 'drdy':
+            print(f"  {stats['n_missed']} conversions missed")
+        print(f"Data saved to {args.fname}")
+        return
 
     # start clock
     start_time = datetime.now()
@@ -66,14 +127,17 @@ def main():
         output_2=spi_2.readbytes(27)
         cs_line.set_value(1)
 
-        data = np.zeros(16)
-        for a in range (3, 25, 3):
-            data[int(a/3)-1] = get_voltage(output_1, a)
-            data[int(a/3)+7] = get_voltage(output_2, a)
+        data = decode_frames(output_1 + output_2, gain=args.gain)[0]
 
         # write data
-        with open(args.fname, 'a') as f:
-            f.write(f"{timepoint}, {data[0]}, {data[1]}, {data[2]}, {data[3]}, {data[4]}, {data[5]}, {data[6]}, {data[7]}, {data[8]}, {data[9]}, {data[10]}, {data[11]}, {data[12]}, {data[13]}, {data[14]}, {data[15]}\n")
+        if args.format == 'binary':
+            writer.write(timepoint, data)
+        else:
+            with open(args.fname, 'a') as f:
+                f.write(f"{timepoint}, {data[0]}, {data[1]}, {data[2]}, {data[3]}, {data[4]}, {data[5]}, {data[6]}, {data[7]}, {data[8]}, {data[9]}, {data[10]}, {data[11]}, {data[12]}, {data[13]}, {data[14]}, {data[15]}\n")
+
+    if args.format == 'binary':
+        writer.close()
             
     print(f"Data saved to {args.fname}")
 
@@ -10,6 +10,11 @@ from scipy.signal import resample
 from neurodsp.spectral import compute_spectrum
 from neurodsp.plts import plot_power_spectra
 
+# imports - custom
+import sys
+sys.path.append('code')
+from cache import read_csv_cached
+
 
 def main():
     # parse command line arguments
@@ -32,7 +37,7 @@ def main():
     # init figure
     fig = plt.figure(figsize=(16, 4), constrained_layout=True)
     gs = fig.add_gridspec(1, 2, width_ratios=[3, 1])
-    data = pd.read_csv(f"{args.path_in}/{args.fname}")
+    data = read_csv_cached(f"{args.path_in}/{args.fname}")
     plot_data(args, fig, gs, data)
 
     # animate
@@ -42,6 +47,7 @@ def main():
 
 
 def update_plot(frame, args, fig, gs):
+    # the recording may still be growing, so it is not cached
     data = pd.read_csv(f"{args.path_in}/{args.fname}")
     plot_data(args, fig, gs, data)
     
@@ -8,9 +8,20 @@ Inputs:
     Default output directory is 'data/silicon_probe/processed_data'.
 - fs: Original sampling frequency of the data (default: 20000 Hz).
 - target_fs: Desired sampling frequency after downsampling (default: 100 Hz).
+- n_jobs: Number of channels to process in parallel (default: 1; -1 uses all 
+    CPUs).
+- apply_filter: Whether to apply an anti-aliasing filter (default: True). The
+    filter is required for streaming; with False, channels are decimated
+    without filtering and processed in memory.
+- dtype: Data type of the saved channels (default: float64; float32 halves the
+    file size).
+- compression: Parquet compression codec (default: snappy).
 
 Outputs:
-- Processed data saved in Parquet format in the specified output directory.
+- Processed data saved in Parquet format in the specified output directory. 
+    With pyarrow installed (and the anti-aliasing filter applied), channels are
+    streamed to the file one time chunk (row group) at a time, so memory use
+    does not grow with recording length.
 
 Usage:
 # required arguments only
@@ -19,45 +30,59 @@ python process_silicon_probe_recording.py --path_in <input_directory>
 # with optional arguments
 python process_silicon_probe_recording.py --path_in <input_directory> 
 --path_out <output_directory> --fs <original_fs> --target_fs <target_fs>
+--apply_filter <True/False> --n_jobs <n_jobs> --dtype <dtype> 
+--compression <codec>
 
 """
 
 # imports
 import os
 import argparse
+import numpy as np
 
 import sys
 sys.path.append("code")
-from sp_utils import process_all_channels
+from sp_utils import process_all_channels, process_all_channels_to_parquet
 
 
-def main(path_in, path_out, fs, target_fs, apply_filter):
-    # check for pyarrow or fastparquet dependency
+def main(path_in, path_out, fs, target_fs, apply_filter, n_jobs=1, 
+         dtype='float64', compression='snappy'):
+    # check for pyarrow or fastparquet dependency; streaming always applies the
+    # anti-aliasing filter (polyphase resampling)
     try:
         import pyarrow
+        streaming = apply_filter
     except ImportError:
         try:
             import fastparquet
+            streaming = False
         except ImportError:
             raise ImportError("Please install either 'pyarrow' or 'fastparquet' to save data in Parquet format.")
 
     # Create output directory
     os.makedirs(path_out, exist_ok=True)
+    output_filename = f"{path_out}/{os.path.basename(path_in)}.parquet"
     
-    # Process data
+    # Process data and save results
     print("Processing all channels...")
-    df = process_all_channels(path_in, fs, target_fs, apply_filter)
-
-    # Save results
-    output_filename = f"{path_out}/{os.path.basename(path_in)}.parquet"
-    print(f"\nSaving data to {output_filename}...")
-    df.to_parquet(output_filename)
+    if streaming:
+        # stream channels to Parquet one time chunk at a time
+        print(f"  Saving data to {output_filename}...")
+        channel_names, n_samples = process_all_channels_to_parquet(
+            path_in, output_filename, fs, target_fs, dtype=np.dtype(dtype), 
+            compression=compression, n_jobs=n_jobs)
+    else:
+        df = process_all_channels(path_in, fs, target_fs, apply_filter, n_jobs)
+        df = df.astype({name: dtype for name in df.columns[:-1]})
+        print(f"\nSaving data to {output_filename}...")
+        df.to_parquet(output_filename, compression=compression)
+        channel_names, n_samples = list(df.columns[:-1]), len(df)
     print("Done!")
 
     # Print some information about the saved data
     print("\nDataset information:")
-    print(f"  Number of channels: {len(df.columns) - 1}")  # -1 for time column
-    print(f"  Duration: {df['time'].max():.2f} seconds")
+    print(f"  Number of channels: {len(channel_names)}")
+    print(f"  Duration: {(n_samples - 1) / target_fs:.2f} seconds")
     print(f"  Original sampling rate: {fs} Hz")
     print(f"  Sampling rate after downsampling: {target_fs} Hz")
 
@@ -78,9 +103,17 @@ if __name__ == "__main__":
                         help="Original sampling frequency (default: 20000 Hz).")
     parser.add_argument("--target_fs", type=int, default=100,
                         help="Desired sampling frequency after downsampling (default: 100 Hz).")
-    parser.add_argument("--apply_filter", type=bool, default=True,
+    parser.add_argument("--apply_filter", type=lambda value: value.lower() in ['true', '1', 'yes'],
+                        default=True,
                         help="Whether to apply an anti-aliasing filter during downsampling (default: True).")
+    parser.add_argument("--n_jobs", type=int, default=1,
+                        help="Number of channels to process in parallel; -1 uses all CPUs (default: 1).")
+    parser.add_argument("--dtype", type=str, default="float64",
+                        help="Data type of the saved channels, e.g. float32 (default: float64).")
+    parser.add_argument("--compression", type=str, default="snappy",
+                        help="Parquet compression codec, e.g. snappy, zstd or gzip (default: snappy).")
     
     args = parser.parse_args()
     
-    main(args.path_in, args.path_out, args.fs, args.target_fs, args.apply_filter)
+    main(args.path_in, args.path_out, args.fs, args.target_fs, args.apply_filter,
+         args.n_jobs, args.dtype, args.compression)